@@ -0,0 +1,53 @@
+"""
+Performance benchmarks for django-stdimage.
+
+Benchmarks are standalone scripts, run them from the repository root::
+
+    python -m benchmarks.reducing_gap
+
+The ``suite`` benchmark covers the whole rendering pipeline and stores
+baselines to compare commits, see ``python -m benchmarks.suite --help``.
+"""
+
+import logging
+import os
+import time
+from io import BytesIO
+
+import django
+from PIL import Image
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+django.setup()
+logging.disable(logging.WARNING)
+
+
+def make_image(size, file_format="JPEG", mode="RGB"):
+    """Return the encoded bytes of a noisy image, similar to a photo."""
+    width, height = size
+    bands = [
+        Image.effect_noise(size, 32),
+        Image.linear_gradient("L").resize(size),
+        Image.radial_gradient("L").resize(size),
+        Image.linear_gradient("L").rotate(90).resize(size),
+    ]
+    img = Image.merge("RGBA", bands).convert(mode)
+    with BytesIO() as f:
+        img.save(f, format=file_format)
+        return f.getvalue()
+
+
+def timeit(func, repeat=5):
+    """Return the best wall time of ``repeat`` calls in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def print_table(header, rows):
+    widths = [max(len(str(c)) for c in column) for column in zip(header, *rows)]
+    for row in [header, *rows]:
+        print("  ".join(str(c).rjust(w) for c, w in zip(row, widths)))
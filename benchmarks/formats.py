@@ -0,0 +1,65 @@
+"""Compare output bytes and encode time of variation formats."""
+
+from io import BytesIO
+
+from PIL import Image
+
+from stdimage.models import JPEGField, StdImageField
+
+from . import make_image, print_table, timeit
+
+SIZES = [(1600, 1200), (400, 300), (100, 75)]
+FORMATS = ["WEBP", "AVIF"]
+
+
+def encode(field_class, variation, img):
+    image, save_kargs = field_class.attr_class.process_variation(
+        variation, image=img.copy()
+    )
+    seconds = timeit(lambda: image.save(BytesIO(), **save_kargs))
+    with BytesIO() as f:
+        image.save(f, **save_kargs)
+        return seconds, len(f.getvalue())
+
+
+def main():
+    Image.init()
+    with Image.open(BytesIO(make_image((4000, 3000), "PNG"))) as img:
+        img.load()
+        rows = []
+        for size in SIZES:
+            variation = JPEGField(variations={"v": size}).variations["v"]
+            source = img.resize(size)
+            source.format = "PNG"
+            baseline_time, baseline_bytes = encode(JPEGField, variation, source)
+            rows.append(
+                (
+                    "%sx%s" % size,
+                    "JPEG web_high",
+                    baseline_bytes,
+                    "100%",
+                    "%.1f ms" % (baseline_time * 1000),
+                )
+            )
+            for file_format in FORMATS:
+                if file_format not in Image.SAVE:
+                    continue
+                variation = StdImageField(
+                    variations={"v": dict(width=size[0], height=size[1])},
+                    formats=(file_format,),
+                ).variations["v_%s" % file_format.lower()]
+                seconds, file_size = encode(StdImageField, variation, source)
+                rows.append(
+                    (
+                        "%sx%s" % size,
+                        file_format,
+                        file_size,
+                        "%d%%" % (100 * file_size / baseline_bytes),
+                        "%.1f ms" % (seconds * 1000),
+                    )
+                )
+    print_table(("size", "format", "bytes", "relative", "encode"), rows)
+
+
+if __name__ == "__main__":
+    main()
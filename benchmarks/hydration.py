@@ -0,0 +1,48 @@
+"""Compare model instance hydration with eager and lazy variation attributes."""
+
+from django.core.management import call_command
+from django.db.models import signals
+
+from tests.models import ResizeModel
+
+from . import print_table, timeit
+
+ROWS = 10000
+ACCESSED = 20
+
+
+def hydrate():
+    for i, obj in enumerate(ResizeModel.objects.all()):
+        if i < ACCESSED:
+            obj.image.thumbnail.name
+
+
+def main():
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    ResizeModel.objects.bulk_create(
+        ResizeModel(image="img/%d.jpg" % i) for i in range(ROWS)
+    )
+    field = ResizeModel._meta.get_field("image")
+
+    # previous behavior: all variations were created on post_init
+    signals.post_init.connect(field.set_variations, sender=ResizeModel)
+    eager = timeit(hydrate)
+    signals.post_init.disconnect(field.set_variations, sender=ResizeModel)
+    lazy = timeit(hydrate)
+
+    print_table(
+        ("rows", "variations", "eager", "lazy", "speedup"),
+        [
+            (
+                ROWS,
+                len(field.variations),
+                "%.1f ms" % (eager * 1000),
+                "%.1f ms" % (lazy * 1000),
+                "%.1fx" % (eager / lazy),
+            )
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Compare the peak memory of encoding variations into memory and a spool."""
+
+import tempfile
+import tracemalloc
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from PIL import Image
+
+from stdimage.models import StdImageField
+
+from . import make_image, print_table
+
+SIZES = [(1200, 800), (2400, 1600), (4000, 3000)]
+
+
+def render_in_memory(field_class, file_name, variations, storage):
+    """Previous implementation, the variation is copied into a ContentFile."""
+    with storage.open(file_name) as f:
+        with Image.open(f) as img:
+            pending = [
+                (v, field_class.get_variation_name(file_name, v["name"]))
+                for v in variations
+            ]
+            for name, image, save_kargs in field_class.process_variations(img, pending):
+                with BytesIO() as file_buffer:
+                    image.save(file_buffer, **save_kargs)
+                    storage.save(name, ContentFile(file_buffer.getvalue()))
+
+
+def render_spooled(field_class, file_name, variations, storage):
+    field_class.batch_render_variations(file_name, variations, True, storage)
+
+
+def measure(func, *args):
+    """Return the peak memory allocated by Python in bytes."""
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    storage = FileSystemStorage(location=tempfile.mkdtemp())
+    field = StdImageField(
+        variations={"retina": (4000, 4000), "large": (1600, 1600)},
+    )
+    # large lossless variations, to make encoding buffers count
+    variations = list(field.variations.values())
+    rows = []
+    for size in SIZES:
+        name = storage.save("%sx%s.png" % size, ContentFile(make_image(size, "PNG")))
+        before = measure(render_in_memory, field.attr_class, name, variations, storage)
+        after = measure(render_spooled, field.attr_class, name, variations, storage)
+        rows.append(
+            (
+                "%sx%s" % size,
+                "%.1f MiB" % (before / 2**20),
+                "%.1f MiB" % (after / 2**20),
+            )
+        )
+    print_table(("source", "in memory", "spooled"), rows)
+
+
+if __name__ == "__main__":
+    main()
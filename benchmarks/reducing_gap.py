@@ -0,0 +1,58 @@
+"""Compare exact and fast ``reducing_gap`` variation rendering."""
+
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+from stdimage.models import StdImageField
+
+from . import make_image, print_table, timeit
+
+SIZES = [(1200, 800), (4000, 3000), (6000, 4000)]
+REDUCING_GAPS = [None, 3.0, 2.0]
+
+
+def get_variations(reducing_gap):
+    field = StdImageField(
+        variations={
+            "large": {"width": 640, "height": 640, "reducing_gap": reducing_gap},
+            "medium": {"width": 320, "height": 320, "reducing_gap": reducing_gap},
+            "thumbnail": {
+                "width": 160,
+                "height": 160,
+                "crop": True,
+                "reducing_gap": reducing_gap,
+            },
+        }
+    )
+    return field.variations.values()
+
+
+def main():
+    storage = FileSystemStorage(location=tempfile.mkdtemp())
+    rows = []
+    for size in SIZES:
+        file_name = storage.save("%sx%s.jpg" % size, ContentFile(make_image(size)))
+        exact = None
+        for reducing_gap in REDUCING_GAPS:
+            variations = get_variations(reducing_gap)
+            seconds = timeit(
+                lambda: StdImageField.attr_class.batch_render_variations(
+                    file_name, variations, replace=True, storage=storage
+                )
+            )
+            exact = exact or seconds
+            rows.append(
+                (
+                    "%sx%s" % size,
+                    reducing_gap or "exact",
+                    "%.1f ms" % (seconds * 1000),
+                    "%.1fx" % (exact / seconds),
+                )
+            )
+    print_table(("source", "reducing_gap", "time", "speedup"), rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Benchmark the rendering pipeline and compare the results to a baseline.
+
+Renders generated sources of several sizes and formats through
+``StdImageFieldFile.render_variations``, a ``JPEGField`` and the
+``rendervariations`` command. Each case runs in a fresh process, to
+measure its peak memory::
+
+    python -m benchmarks.suite --save main
+    python -m benchmarks.suite --compare main
+
+Baselines are stored as JSON files in the ``.benchmarks`` directory.
+"""
+
+import argparse
+import concurrent.futures
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+
+import PIL
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+
+from . import make_image, print_table, timeit
+
+#: Source sizes by megapixels.
+SIZES = {1: (1224, 816), 12: (4240, 2832), 50: (8660, 5773)}
+#: Source formats and image modes.
+FORMATS = {"JPEG": "RGB", "PNG": "RGBA", "GIF": "P"}
+EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif"}
+PATHS = ["field", "jpeg_field", "command"]
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".benchmarks")
+
+
+def get_memory(key):
+    """Return the current (VmRSS) or peak (VmHWM) resident memory in bytes."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # the peak memory of child processes includes their parent's on fork
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def reset_peak_memory():
+    """Reset the peak resident memory to the current, on Linux."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def run_case(path, source_path, file_name, repeat, rows):
+    """Run a single benchmark case, in a fresh worker process."""
+    from tests.models import JPEGModel, ResizeModel
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    with open(source_path, "rb") as f:
+        file_name = default_storage.save(file_name, File(f))
+
+    if path == "command":
+        ResizeModel.objects.bulk_create(
+            ResizeModel(image=file_name) for _ in range(rows)
+        )
+
+        def func():
+            call_command(
+                "rendervariations",
+                "tests.ResizeModel.image",
+                replace=True,
+                stdout=io.StringIO(),
+            )
+
+        renders = rows
+    else:
+        model_class = JPEGModel if path == "jpeg_field" else ResizeModel
+        obj = model_class(image=file_name)
+        func = obj.image.render_variations
+        renders = 1
+
+    reset_peak_memory()
+    before = get_memory("VmRSS")
+    seconds = timeit(func, repeat)
+    return {
+        "seconds": seconds,
+        "renders": renders,
+        "peak_memory": max(get_memory("VmHWM") - before, 0),
+    }
+
+
+def get_metadata():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def run(sizes, formats, paths, repeat, rows):
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        for megapixels in sizes:
+            for file_format in formats:
+                size = SIZES[megapixels]
+                ext = EXTENSIONS[file_format]
+                source_path = os.path.join(tmp, "source.%s" % ext)
+                with open(source_path, "wb") as f:
+                    f.write(make_image(size, file_format, FORMATS[file_format]))
+                for path in paths:
+                    # a new process per case, so peak memory is not shared
+                    with concurrent.futures.ProcessPoolExecutor(
+                        1, mp_context=context
+                    ) as pool:
+                        result = pool.submit(
+                            run_case,
+                            path,
+                            source_path,
+                            "bench/%dmp.%s" % (megapixels, ext),
+                            repeat,
+                            rows,
+                        ).result()
+                    result["megapixels"] = size[0] * size[1] / 10**6
+                    key = "%s:%dmp:%s" % (path, megapixels, file_format)
+                    results[key] = result
+                    print(".", end="", file=sys.stderr, flush=True)
+    print(file=sys.stderr)
+    return results
+
+
+def format_results(results, baseline=None):
+    rows = []
+    for key, result in results.items():
+        throughput = result["megapixels"] * result["renders"] / result["seconds"]
+        row = [
+            *key.split(":"),
+            "%.1f ms" % (result["seconds"] * 1000),
+            "%.1f MP/s" % throughput,
+            "%.1f MiB" % (result["peak_memory"] / 2**20),
+        ]
+        if baseline is not None:
+            try:
+                previous = baseline["results"][key]["seconds"]
+            except KeyError:
+                row.append("-")
+            else:
+                row.append("%+.1f%%" % ((result["seconds"] / previous - 1) * 100))
+        rows.append(row)
+    header = ["path", "source", "format", "time", "throughput", "peak memory"]
+    if baseline is not None:
+        header.append("vs %s" % (baseline["metadata"]["commit"] or "baseline"))
+    return header, rows
+
+
+def get_regressions(results, baseline, threshold):
+    """Return the cases that are more than ``threshold`` slower."""
+    return [
+        key
+        for key, result in results.items()
+        if key in baseline["results"]
+        and result["seconds"] > baseline["results"][key]["seconds"] * (1 + threshold)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(i) for i in value.split(",")],
+        default=sorted(SIZES),
+        help="Comma separated source sizes in megapixels, of %s." % sorted(SIZES),
+    )
+    parser.add_argument(
+        "--formats",
+        type=lambda value: value.upper().split(","),
+        default=list(FORMATS),
+        help="Comma separated source formats, of %s." % list(FORMATS),
+    )
+    parser.add_argument(
+        "--paths",
+        type=lambda value: value.split(","),
+        default=PATHS,
+        help="Comma separated render paths, of %s." % PATHS,
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--rows", type=int, default=4, help="Rows rendered by the command."
+    )
+    parser.add_argument("--save", metavar="NAME", help="Save results as baseline.")
+    parser.add_argument("--compare", metavar="NAME", help="Compare to a baseline.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Exit with an error, if a case is slower than the baseline "
+        "by more than this fraction. Default: 0.2",
+    )
+    args = parser.parse_args(argv)
+    if (
+        not set(args.sizes) <= set(SIZES)
+        or not set(args.formats) <= set(FORMATS)
+        or not set(args.paths) <= set(PATHS)
+    ):
+        parser.error("Unknown size, format or path.")
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, "%s.json" % args.compare)) as f:
+            baseline = json.load(f)
+
+    results = run(args.sizes, args.formats, args.paths, args.repeat, args.rows)
+    print_table(*format_results(results, baseline))
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, "%s.json" % args.save), "w") as f:
+            json.dump({"metadata": get_metadata(), "results": results}, f, indent=2)
+
+    if baseline is not None:
+        regressions = get_regressions(results, baseline, args.threshold)
+        if regressions:
+            print("Slower than baseline: %s" % ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
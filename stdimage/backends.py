@@ -0,0 +1,168 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core import signing
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+
+class BaseRenderBackend:
+    """
+    Base class for variation render backends.
+
+    A backend instance can be passed as ``render_variations`` to a
+    :class:`.StdImageField`. It is called with the field file, once the
+    original image has been saved to the storage.
+    """
+
+    def render(self, field_file):
+        """Render or schedule rendering of all variations of the field file."""
+        raise NotImplementedError
+
+
+class InlineRenderBackend(BaseRenderBackend):
+    """Render all variations inline, the same as ``render_variations=True``."""
+
+    def render(self, field_file):
+        field_file.render_variations()
+
+
+class ThreadPoolRenderBackend(BaseRenderBackend):
+    """
+    Render variations in a thread pool outside the request.
+
+    At most ``max_queue_size`` files are queued or being rendered at any
+    time. If the queue is full, scheduling blocks until a slot is free.
+    """
+
+    def __init__(self, max_workers=None, max_queue_size=100):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_queue_size)
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="stdimage",
+                )
+            return self._executor
+
+    def render(self, field_file):
+        self._slots.acquire()
+        try:
+            future = self.executor.submit(
+                field_file.batch_render_variations,
+                field_file.name,
+                list(field_file.field.variations.values()),
+                True,
+                field_file.storage,
+                **field_file.field.get_render_kwargs(),
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self._slots.release()
+        exc = future.exception()
+        if exc is not None:
+            logger.error("Rendering variations failed.", exc_info=exc)
+
+    def shutdown(self, wait=True):
+        """Wait for all queued renders to finish and stop the worker threads."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+class DatabaseRenderBackend(BaseRenderBackend):
+    """
+    Store render jobs in the database, to be rendered by ``stdimage_worker``.
+
+    Requires ``stdimage.jobs`` to be added to the ``INSTALLED_APPS``. Jobs
+    are durable and do not require a message broker. They are
+    deduplicated per file name and variation. Jobs are created within the
+    current transaction and are discarded if the transaction is rolled back.
+    """
+
+    def render(self, field_file):
+        from .jobs.models import RenderJob
+
+        field = field_file.field
+        field_path = "%s.%s" % (field.model._meta.label, field.name)
+        RenderJob.objects.bulk_create(
+            [
+                RenderJob(
+                    field_path=field_path,
+                    file_name=field_file.name,
+                    variation=variation,
+                )
+                for variation in field.variations
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class LazyRenderBackend(BaseRenderBackend):
+    """
+    Render variations on demand, when they are requested for the first time.
+
+    Nothing is rendered on upload. Variation URLs point to a view, see
+    :mod:`stdimage.urls`, that renders the variation on the first request
+    and serves it from the storage afterwards. URLs are signed, so only
+    variations of existing fields can be requested.
+
+    Concurrent first requests of the same variation are serialized by a
+    lock in the ``cache_alias`` cache. The cache must be shared by all
+    processes serving the view, e.g. Memcached or Redis.
+
+    Args:
+        max_age (int): ``Cache-Control`` max-age of served variations.
+        lock_timeout (int): Seconds a request waits for another request
+            rendering the same variation.
+        redirect (bool): Redirect to the storage URL, instead of serving
+            the file through the view, e.g. for cloud storages.
+        cache_alias (str): The cache used for render locks.
+
+    """
+
+    salt = "stdimage.backends.LazyRenderBackend"
+
+    def __init__(
+        self, max_age=86400, lock_timeout=30, redirect=False, cache_alias="default"
+    ):
+        self.max_age = max_age
+        self.lock_timeout = lock_timeout
+        self.redirect = redirect
+        self.cache_alias = cache_alias
+
+    def render(self, field_file):
+        pass
+
+    @classmethod
+    def get_signature(cls, field_path, variation, file_name):
+        return signing.Signer(salt=cls.salt).signature(
+            "%s:%s:%s" % (field_path, variation, file_name)
+        )
+
+    def get_url(self, field, file_name, variation):
+        """Return the URL of the view rendering the variation of a file."""
+        field_path = "%s.%s" % (field.model._meta.label_lower, field.name)
+        return reverse(
+            "stdimage:variation",
+            kwargs={
+                "signature": self.get_signature(field_path, variation, file_name),
+                "field_path": field_path,
+                "variation": variation,
+                "file_name": file_name,
+            },
+        )
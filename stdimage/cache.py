@@ -0,0 +1,113 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+from .fingerprints import get_fingerprint
+
+
+class RenderCache:
+    """
+    In-memory cache of rendered variations, keyed by the source file content.
+
+    Identical source files, like stock images or default avatars, are
+    rendered only once per variation. Later renders copy the cached bytes
+    to the storage, without decoding or encoding the image again.
+
+    The cache holds up to ``max_size`` bytes of rendered variations. The
+    least recently used variations are evicted first.
+    """
+
+    def __init__(self, max_size=32 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        # Worker processes start with an empty cache of their own.
+        return {"max_size": self.max_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @staticmethod
+    def get_source_hash(content):
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def get_key(source_hash, variation, field_class):
+        """Return the cache key for a variation of a source file."""
+        return "%s:%s" % (source_hash, get_fingerprint(variation, field_class))
+
+    def get(self, key):
+        """Return the cached content or ``None``."""
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._entries[key]
+
+    def set(self, key, content):
+        if len(content) > self.max_size:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size -= len(self._entries.pop(key))
+            self._entries[key] = content
+            self.size += len(content)
+            while self.size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = self.hits = self.misses = 0
+
+
+class URLCache:
+    """
+    Cache of file URLs, backed by Django's cache framework.
+
+    Storages that sign URLs, like S3, make a URL expensive to compute.
+    The cached URLs are shared by all processes using the cache. The
+    ``timeout`` must be shorter than the expiry of signed URLs.
+    """
+
+    def __init__(self, timeout=3600, cache_alias="default", key_prefix="stdimage:url"):
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def get_key(self, storage, name):
+        key = "%r:%s" % (storage.deconstruct(), name)
+        return "%s:%s" % (self.key_prefix, hashlib.sha256(key.encode()).hexdigest())
+
+    def get_url(self, storage, name):
+        return self.get_many(storage, [name])[name]
+
+    def get_many(self, storage, names):
+        """Return the URLs of many files by name, with a single cache lookup."""
+        keys = {self.get_key(storage, name): name for name in names}
+        urls = {keys[key]: url for key, url in self.cache.get_many(keys).items()}
+        missing = {
+            key: storage.url(name) for key, name in keys.items() if name not in urls
+        }
+        if missing:
+            self.cache.set_many(missing, self.timeout)
+            urls.update((keys[key], url) for key, url in missing.items())
+        return urls
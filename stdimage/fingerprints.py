@@ -0,0 +1,74 @@
+import hashlib
+import json
+import posixpath
+from collections.abc import Mapping
+
+from django.core.files.base import ContentFile
+
+
+def _to_json(value):
+    return dict(value) if isinstance(value, Mapping) else repr(value)
+
+
+def get_fingerprint(variation, field_class):
+    """
+    Return a fingerprint of a variation definition.
+
+    The fingerprint changes whenever the rendered output of the variation
+    might change, the variation name is not part of it.
+    """
+    variation = {k: v for k, v in variation.items() if k != "name"}
+    variation["field_class"] = "%s.%s" % (
+        field_class.__module__,
+        field_class.__qualname__,
+    )
+    variation = json.dumps(variation, sort_keys=True, default=_to_json)
+    return hashlib.sha256(variation.encode()).hexdigest()
+
+
+def get_fingerprints(field):
+    """Return the fingerprints of all variations of a field by name."""
+    return {
+        name: get_fingerprint(variation, field.attr_class)
+        for name, variation in field.variations.items()
+    }
+
+
+class FingerprintManifest:
+    """
+    Fingerprints of the variations all files of a field were rendered with.
+
+    The manifest is a JSON file stored next to the images, in the storage
+    of the field.
+    """
+
+    location = ".stdimage"
+
+    def __init__(self, field):
+        self.storage = field.storage
+        self.name = posixpath.join(
+            self.location, "%s.%s.json" % (field.model._meta.label_lower, field.name)
+        )
+
+    def load(self):
+        """Return the stored fingerprints or an empty dict."""
+        if not self.storage.exists(self.name):
+            return {}
+        with self.storage.open(self.name) as f:
+            return json.loads(f.read())
+
+    def save(self, fingerprints):
+        if self.storage.exists(self.name):
+            self.storage.delete(self.name)
+        self.storage.save(
+            self.name, ContentFile(json.dumps(fingerprints, sort_keys=True).encode())
+        )
+
+    def get_changed(self, field):
+        """Return the names of variations that changed since the last render."""
+        stored = self.load()
+        return {
+            name
+            for name, fingerprint in get_fingerprints(field).items()
+            if stored.get(name) != fingerprint
+        }
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+from django.utils.translation import gettext_lazy as _
+
+
+class JobsConfig(AppConfig):
+    name = "stdimage.jobs"
+    label = "stdimage_jobs"
+    verbose_name = _("Image render jobs")
+    default_auto_field = "django.db.models.AutoField"
@@ -0,0 +1,136 @@
+import datetime
+import itertools
+import logging
+import time
+
+from django.apps import apps
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from stdimage.jobs.models import RenderJob
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Renders variations queued by the DatabaseRenderBackend."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            dest="batch_size",
+            default=100,
+            help="Number of jobs fetched from the database at once.",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            dest="max_attempts",
+            default=3,
+            help="Number of attempts before a failing job is skipped.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            dest="timeout",
+            default=3600.0,
+            help="Seconds after which jobs claimed by a crashed worker are retried.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            dest="sleep",
+            default=1.0,
+            help="Seconds to wait for new jobs, if the queue is empty.",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            dest="burst",
+            default=False,
+            help="Exit once the queue is empty.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options.get("batch_size", 100)
+        max_attempts = options.get("max_attempts", 3)
+        timeout = options.get("timeout", 3600.0)
+        while self.process_batch(batch_size, max_attempts, timeout):
+            pass
+        while not options.get("burst", False):
+            time.sleep(options.get("sleep", 1.0))
+            while self.process_batch(batch_size, max_attempts, timeout):
+                pass
+
+    def process_batch(self, batch_size, max_attempts, timeout=3600.0):
+        """Render a batch of jobs and return the number of processed jobs."""
+        jobs = self.claim_batch(batch_size, max_attempts, timeout)
+        # render all variations of a file at once, to decode it only once
+        key = lambda job: (job.field_path, job.file_name)  # noqa: E731
+        for (field_path, file_name), group in itertools.groupby(
+            sorted(jobs, key=key), key=key
+        ):
+            group = list(group)
+            # jobs taken over by another worker after the timeout are left alone
+            claimed = RenderJob.objects.filter(
+                pk__in=[job.pk for job in group], claimed=group[0].claimed
+            )
+            try:
+                self.render(field_path, file_name, [job.variation for job in group])
+            except FileNotFoundError:
+                logger.warning('Source file "%s" was not found.', file_name)
+            except Exception:
+                logger.exception('Rendering variations of "%s" failed.', file_name)
+                # the attempt has been counted when the jobs were claimed
+                claimed.update(claimed=None)
+                continue
+            claimed.delete()
+            self.stdout.write(f"Processed: {file_name}", self.style.NOTICE)
+        return len(jobs)
+
+    @staticmethod
+    def claim_batch(batch_size, max_attempts, timeout):
+        """
+        Claim a batch of jobs for this worker and return them.
+
+        Jobs are claimed in a short transaction, rendering happens outside of
+        it. Every claim counts as an attempt. Jobs claimed more than
+        ``timeout`` seconds ago, by a worker that crashed, are claimed again.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            jobs = list(
+                RenderJob.objects.select_for_update(skip_locked=True)
+                .filter(attempts__lt=max_attempts)
+                .filter(
+                    Q(claimed__isnull=True)
+                    | Q(claimed__lt=now - datetime.timedelta(seconds=timeout))
+                )
+                .order_by("pk")[:batch_size]
+            )
+            RenderJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                claimed=now, attempts=F("attempts") + 1
+            )
+        for job in jobs:
+            job.claimed = now
+        return jobs
+
+    @staticmethod
+    def render(field_path, file_name, variation_names):
+        app_label, model_name, field_name = field_path.rsplit(".")
+        field = apps.get_model(app_label, model_name)._meta.get_field(field_name)
+        variations = [
+            field.variations[name]
+            for name in variation_names
+            if name in field.variations
+        ]
+        field.attr_class.batch_render_variations(
+            file_name,
+            variations,
+            True,
+            field.storage,
+            **field.get_render_kwargs(),
+        )
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-17 15:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="RenderJob",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("field_path", models.CharField(max_length=255)),
+                ("file_name", models.CharField(max_length=255)),
+                ("variation", models.CharField(max_length=255)),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="renderjob",
+            constraint=models.UniqueConstraint(
+                fields=("file_name", "variation"), name="stdimage_unique_render_job"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-17 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("stdimage_jobs", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="renderjob",
+            name="claimed",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
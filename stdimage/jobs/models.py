@@ -0,0 +1,22 @@
+from django.db import models
+
+
+class RenderJob(models.Model):
+    """Variation render job, created by the ``DatabaseRenderBackend``."""
+
+    field_path = models.CharField(max_length=255)
+    file_name = models.CharField(max_length=255)
+    variation = models.CharField(max_length=255)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed = models.DateTimeField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["file_name", "variation"], name="stdimage_unique_render_job"
+            ),
+        ]
+
+    def __str__(self):
+        return "%s: %s" % (self.file_name, self.variation)
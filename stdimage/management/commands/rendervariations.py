@@ -1,7 +1,25 @@
+import concurrent.futures
+import contextlib
+import functools
+import itertools
+import json
+import posixpath
+from collections import deque
+
+import django
 from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
 from django.core.files.storage import get_storage_class
 from django.core.management import BaseCommand, CommandError
+from django.db import models
+from django.db.models.functions import Mod
+from django.utils.text import slugify
 
+from stdimage.backends import BaseRenderBackend
+from stdimage.fingerprints import FingerprintManifest, get_fingerprints
+from stdimage.stats import RenderStats
+from stdimage.storage import StorageIndex
 from stdimage.utils import render_variations
 
 
@@ -29,11 +47,107 @@ class Command(BaseCommand):
             default=False,
             help="Ignore missing source file error and " "skip render for that file",
         )
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            dest="workers",
+            default=1,
+            help="Number of parallel workers used to render variations.",
+        )
+        parser.add_argument(
+            "--executor",
+            choices=("process", "thread"),
+            dest="executor",
+            default="process",
+            help="Use a process or a thread pool for parallel workers.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            dest="chunk_size",
+            default=10,
+            help="Number of files submitted to a worker at once.",
+        )
+        parser.add_argument(
+            "--changed-only",
+            action="store_true",
+            dest="changed_only",
+            default=False,
+            help="Only replace variations that changed since the last "
+            "full --replace or --changed-only run and render missing ones.",
+        )
+        parser.add_argument(
+            "--store-fingerprints",
+            action="store_true",
+            dest="store_fingerprints",
+            default=False,
+            help="Mark all variations as up to date for --changed-only, "
+            "without rendering, e.g. after a backfill split in ranges or shards.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            dest="batch_size",
+            default=1000,
+            help="Number of rows fetched at once and between checkpoints.",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            dest="resume",
+            default=False,
+            help="Continue an interrupted run from its last checkpoint.",
+        )
+        parser.add_argument(
+            "--pk-range",
+            dest="pk_range",
+            default=None,
+            metavar="START:END",
+            help="Only render rows with START <= pk < END, either may be omitted.",
+        )
+        parser.add_argument(
+            "--shard",
+            dest="shard",
+            default=None,
+            metavar="I/N",
+            help="Only render the I-th of N shards of rows, split by integer pk.",
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            dest="stats",
+            default=False,
+            help="Print render durations and sizes per variation.",
+        )
 
     def handle(self, *args, **options):
         replace = options.get("replace", False)
         ignore_missing = options.get("ignore_missing", False)
         routes = options.get("field_path", [])
+        workers = options.get("workers", 1)
+        executor = options.get("executor", "process")
+        chunk_size = options.get("chunk_size", 10)
+        stats = RenderStats() if options.get("stats", False) else None
+        changed_only = options.get("changed_only", False)
+        batch_size = options.get("batch_size", 1000)
+        resume = options.get("resume", False)
+        pk_range = options.get("pk_range")
+        shard = options.get("shard")
+        store_fingerprints = options.get("store_fingerprints", False)
+        if workers < 1 or chunk_size < 1 or batch_size < 1:
+            raise CommandError(
+                "Workers, chunk size and batch size must be positive integers."
+            )
+        if replace and changed_only:
+            raise CommandError("The replace and changed-only options are exclusive.")
+        if store_fingerprints and (
+            replace or changed_only or resume or pk_range or shard
+        ):
+            raise CommandError(
+                "The store-fingerprints option doesn't render, it can't be "
+                "combined with render options."
+            )
         for route in routes:
             try:
                 app_label, model_name, field_name = route.rsplit(".")
@@ -44,21 +158,66 @@ class Command(BaseCommand):
                 )
             model_class = apps.get_model(app_label, model_name)
             field = model_class._meta.get_field(field_name)
+            manifest = FingerprintManifest(field)
+            if store_fingerprints:
+                manifest.save(get_fingerprints(field))
+                continue
+            field_replace = manifest.get_changed(field) if changed_only else replace
 
             queryset = model_class._default_manager.exclude(
                 **{"%s__isnull" % field_name: True}
             ).exclude(**{field_name: ""})
+            queryset = self.filter_pk_range(queryset, pk_range)
+            queryset = self.filter_shard(queryset, shard)
+            checkpoint = Checkpoint(field, pk_range, shard, batch_size)
+            if resume:
+                last_pk = checkpoint.load()
+                if last_pk is not None:
+                    queryset = queryset.filter(pk__gt=last_pk)
             obj = queryset.first()
             do_render = True
             if obj:
                 f = getattr(obj, field_name)
                 do_render = f.field.render_variations
-            images = queryset.values_list(field_name, flat=True).iterator()
+                if isinstance(do_render, BaseRenderBackend):
+                    do_render = True
+            images = checkpoint.track(self.iter_rows(queryset, field_name, batch_size))
             count = queryset.count()
 
-            self.render(field, images, count, replace, ignore_missing, do_render)
+            self.render(
+                field,
+                images,
+                count,
+                field_replace,
+                ignore_missing,
+                do_render,
+                workers,
+                executor,
+                chunk_size,
+                stats,
+                checkpoint,
+            )
+            checkpoint.delete()
+            # A partial run doesn't bring the rows outside its range up to date.
+            if (replace or changed_only) and pk_range is None and shard is None:
+                manifest.save(get_fingerprints(field))
+        if stats is not None:
+            self.stdout.write(stats.format_table())
 
-    def render(self, field, images, count, replace, ignore_missing, do_render):
+    def render(
+        self,
+        field,
+        images,
+        count,
+        replace,
+        ignore_missing,
+        do_render,
+        workers=1,
+        executor="process",
+        chunk_size=10,
+        stats=None,
+        checkpoint=None,
+    ):
         kwargs_list = (
             dict(
                 file_name=file_name,
@@ -68,41 +227,220 @@ class Command(BaseCommand):
                 storage=field.storage.deconstruct()[0],
                 field_class=field.attr_class,
                 ignore_missing=ignore_missing,
+                render_kwargs=field.get_render_kwargs(),
             )
             for file_name in images
         )
+        # storage indexes must not outlive a single render
+        get_storage.cache_clear()
+        file_names = self.map(kwargs_list, workers, executor, chunk_size, stats)
+        if checkpoint is not None:
+            file_names = checkpoint.complete(file_names)
+        with stats or contextlib.nullcontext():
+            try:
+                import progressbar
+            except ImportError:
+                for file_name in file_names:
+                    self.stdout.write(f"Processing: {file_name}", self.style.NOTICE)
+            else:
+                with progressbar.ProgressBar(
+                    max_value=count,
+                    widgets=(
+                        progressbar.RotatingMarker(),
+                        " | ",
+                        progressbar.AdaptiveETA(),
+                        " | ",
+                        progressbar.Percentage(),
+                        " ",
+                        progressbar.Bar(),
+                    ),
+                ) as bar:
+                    for _ in file_names:
+                        bar += 1
+
+    @staticmethod
+    def filter_pk_range(queryset, pk_range):
+        if not pk_range:
+            return queryset
+        pk_field = queryset.model._meta.pk
         try:
-            import progressbar
-        except ImportError:
-            for file_name in map(render_field_variations, kwargs_list):
-                self.stdout.write(f"Processing: {file_name}", self.style.NOTICE)
+            start, end = (
+                pk_field.to_python(value) if value else None
+                for value in pk_range.split(":")
+            )
+        except (ValueError, ValidationError):
+            raise CommandError(
+                "Error parsing pk range '{}'. Use format START:END.".format(pk_range)
+            )
+        if start is not None:
+            queryset = queryset.filter(pk__gte=start)
+        if end is not None:
+            queryset = queryset.filter(pk__lt=end)
+        return queryset
+
+    @staticmethod
+    def filter_shard(queryset, shard):
+        if not shard:
+            return queryset
+        try:
+            index, total = (int(value) for value in shard.split("/"))
+        except ValueError:
+            index = total = 0
+        if not 1 <= index <= total:
+            raise CommandError(
+                "Error parsing shard '{}'. Use format I/N, "
+                "with 1 <= I <= N.".format(shard)
+            )
+        if not isinstance(queryset.model._meta.pk, models.IntegerField):
+            raise CommandError("Shards require an integer primary key.")
+        return queryset.annotate(_stdimage_shard=Mod("pk", total)).filter(
+            _stdimage_shard=index - 1
+        )
+
+    @staticmethod
+    def iter_rows(queryset, field_name, batch_size):
+        """
+        Yield the primary key and file name of all rows, ordered by pk.
+
+        Rows are fetched in batches, each one starting after the last pk of
+        the previous batch, so later batches are as cheap as the first one.
+        """
+        queryset = queryset.order_by("pk").values_list("pk", field_name)
+        rows = list(queryset[:batch_size])
+        while rows:
+            yield from rows
+            rows = list(queryset.filter(pk__gt=rows[-1][0])[:batch_size])
+
+    @staticmethod
+    def map(kwargs_list, workers, executor, chunk_size, stats=None):
+        """
+        Render variations for all files, yielding the file names in order.
+
+        With more than one worker, files are submitted to a pool in chunks.
+        Only a bounded number of chunks is in flight at any time, so the
+        file name iterator is never fully materialized.
+
+        Render signals are not received across processes. Worker processes
+        collect their own statistics, which are merged into ``stats``.
+        """
+        if workers == 1:
+            yield from map(render_field_variations, kwargs_list)
+            return
+
+        if executor == "process":
+            pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=django.setup
+            )
+            collect_stats = stats is not None
         else:
-            with progressbar.ProgressBar(
-                max_value=count,
-                widgets=(
-                    progressbar.RotatingMarker(),
-                    " | ",
-                    progressbar.AdaptiveETA(),
-                    " | ",
-                    progressbar.Percentage(),
-                    " ",
-                    progressbar.Bar(),
-                ),
-            ) as bar:
-                for _ in map(render_field_variations, kwargs_list):
-                    bar += 1
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            collect_stats = False
+
+        def results(future):
+            file_names, chunk_stats = future.result()
+            if chunk_stats is not None:
+                stats.merge(chunk_stats)
+            return file_names
+
+        pending = deque()
+        try:
+            chunks = iter(lambda: list(itertools.islice(kwargs_list, chunk_size)), [])
+            for chunk in chunks:
+                pending.append(
+                    pool.submit(render_chunk_variations, chunk, collect_stats)
+                )
+                if len(pending) >= workers * 2:
+                    yield from results(pending.popleft())
+            while pending:
+                yield from results(pending.popleft())
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown()
+
+
+class Checkpoint:
+    """
+    The last primary key of a run, for which all rows have been rendered.
+
+    The checkpoint is stored as a JSON file in the ``.stdimage`` directory of
+    the field's storage. Runs limited to a pk range or shard have their own
+    checkpoint, so they can be resumed independently.
+    """
+
+    location = ".stdimage"
+
+    def __init__(self, field, pk_range=None, shard=None, interval=1000):
+        self.storage = field.storage
+        self.pk_field = field.model._meta.pk
+        self.interval = interval
+        name = [field.model._meta.label_lower, field.name]
+        if pk_range:
+            name.append("pk-%s" % slugify(pk_range.replace(":", "-to-")))
+        if shard:
+            name.append("shard-%s" % slugify(shard.replace("/", "-of-")))
+        self.name = posixpath.join(self.location, "%s.checkpoint.json" % ".".join(name))
+        self._pending = deque()
+
+    def load(self):
+        """Return the last completed primary key or ``None``."""
+        if not self.storage.exists(self.name):
+            return None
+        with self.storage.open(self.name) as f:
+            return self.pk_field.to_python(json.loads(f.read())["pk"])
+
+    def save(self, pk):
+        self.delete()
+        self.storage.save(self.name, ContentFile(json.dumps({"pk": str(pk)}).encode()))
+
+    def delete(self):
+        if self.storage.exists(self.name):
+            self.storage.delete(self.name)
+
+    def track(self, rows):
+        """Yield the file names of ``(pk, file_name)`` rows, remembering the pks."""
+        for pk, file_name in rows:
+            self._pending.append(pk)
+            yield file_name
+
+    def complete(self, file_names):
+        """
+        Pass through the rendered file names, in the order of :meth:`track`.
+
+        A checkpoint is saved every ``interval`` rendered files.
+        """
+        for count, file_name in enumerate(file_names, start=1):
+            pk = self._pending.popleft()
+            if count % self.interval == 0:
+                self.save(pk)
+            yield file_name
+
+
+def render_chunk_variations(kwargs_list, collect_stats=False):
+    if not collect_stats:
+        return [render_field_variations(kwargs) for kwargs in kwargs_list], None
+    with RenderStats() as stats:
+        return [render_field_variations(kwargs) for kwargs in kwargs_list], stats
+
+
+@functools.lru_cache(maxsize=None)
+def get_storage(import_path):
+    """Return a storage instance and index, shared within a worker process."""
+    storage = get_storage_class(import_path)()
+    return storage, StorageIndex(storage)
 
 
 def render_field_variations(kwargs):
-    kwargs["storage"] = get_storage_class(kwargs["storage"])()
+    kwargs["storage"], index = get_storage(kwargs["storage"])
     ignore_missing = kwargs.pop("ignore_missing")
     do_render = kwargs.pop("do_render")
+    render_kwargs = kwargs.pop("render_kwargs")
     try:
         if callable(do_render):
             kwargs.pop("field_class")
             do_render = do_render(**kwargs)
         if do_render:
-            render_variations(**kwargs)
+            render_variations(index=index, **render_kwargs, **kwargs)
     except FileNotFoundError as e:
         if not ignore_missing:
             print(ignore_missing)
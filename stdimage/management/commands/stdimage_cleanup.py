@@ -0,0 +1,193 @@
+import bisect
+import hashlib
+import heapq
+import itertools
+import posixpath
+from array import array
+
+from django.apps import apps
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+
+from stdimage.fingerprints import FingerprintManifest
+from stdimage.storage import delete_files
+
+
+class FileNameSet:
+    """
+    Compact set of file names, for millions of names.
+
+    Names are stored as a sorted array of 64-bit hashes, 8 bytes per name.
+    Hash collisions may cause an unknown name to be reported as contained,
+    never the other way around.
+    """
+
+    def __init__(self, names, batch_size=100000):
+        names = iter(names)
+        batches = [
+            array("Q", sorted(map(self.hash, batch)))
+            for batch in iter(lambda: list(itertools.islice(names, batch_size)), [])
+        ]
+        self._hashes = array(
+            "Q", (k for k, _ in itertools.groupby(heapq.merge(*batches)))
+        )
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, name):
+        value = self.hash(name)
+        i = bisect.bisect_left(self._hashes, value)
+        return i < len(self._hashes) and self._hashes[i] == value
+
+    @staticmethod
+    def hash(name):
+        return int.from_bytes(
+            hashlib.blake2b(name.encode(), digest_size=8).digest(), "big"
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports or deletes files in the upload directories of StdImageFields"
+        " that are not referenced by any row, including their variations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "field_path", nargs="+", type=str, help="<app.model.field app.model.field>"
+        )
+        parser.add_argument(
+            "--directory",
+            action="append",
+            dest="directories",
+            default=None,
+            help="Storage directory to sweep, defaults to the upload_to path of "
+            "the fields. May be given multiple times.",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            dest="min_age",
+            default=3600,
+            help="Skip files modified less than this many seconds ago, "
+            "they might belong to rows that are not committed yet.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            default=False,
+            help="Only report unreferenced files, do not delete them.",
+        )
+
+    def handle(self, *args, **options):
+        fields = [self.get_field(route) for route in options["field_path"]]
+        storage = fields[0].storage
+        if any(field.storage is not storage for field in fields):
+            raise CommandError("All fields must use the same storage.")
+        directories = options.get("directories") or sorted(
+            {self.get_directory(field) for field in fields}
+        )
+        dry_run = options.get("dry_run", False)
+        min_age = options.get("min_age", 3600)
+        verbosity = options.get("verbosity", 1)
+
+        referenced = FileNameSet(
+            itertools.chain.from_iterable(
+                self.get_referenced_names(field) for field in fields
+            )
+        )
+        if verbosity > 1:
+            self.stdout.write("Found %d referenced files." % len(referenced))
+
+        orphans = (
+            name
+            for directory in directories
+            for name in self.walk(storage, directory)
+            if name not in referenced and self.is_old(storage, name, min_age)
+        )
+        count = 0
+        if dry_run:
+            for count, name in enumerate(orphans, start=1):
+                self.stdout.write(name)
+            self.stdout.write("Found %d unreferenced files." % count)
+        else:
+
+            def log(names):
+                nonlocal count
+                for name in names:
+                    count += 1
+                    if verbosity > 1:
+                        self.stdout.write(name)
+                    yield name
+
+            delete_files(storage, log(orphans))
+            self.stdout.write("Deleted %d unreferenced files." % count)
+
+    @staticmethod
+    def get_field(route):
+        try:
+            app_label, model_name, field_name = route.rsplit(".")
+        except ValueError:
+            raise CommandError(
+                "Error parsing field_path '{}'. Use format "
+                "<app.model.field app.model.field>.".format(route)
+            )
+        model_class = apps.get_model(app_label, model_name)
+        return model_class._meta.get_field(field_name)
+
+    @staticmethod
+    def get_directory(field):
+        """Return the static part of the field's ``upload_to`` path."""
+        if callable(field.upload_to):
+            raise CommandError(
+                "The upload_to path of '{}' is a callable, use --directory to "
+                "specify the directory to sweep.".format(field)
+            )
+        directory = field.upload_to.split("%")[0]
+        if not directory.endswith("/"):
+            directory = posixpath.dirname(directory)
+        directory = directory.rstrip("/")
+        if not directory:
+            raise CommandError(
+                "'{}' uploads to the storage root, use --directory to "
+                "specify the directory to sweep.".format(field)
+            )
+        return directory
+
+    @staticmethod
+    def get_referenced_names(field):
+        """Yield the names of all files and variations referenced by the field."""
+        queryset = (
+            field.model._default_manager.exclude(**{"%s__isnull" % field.name: True})
+            .exclude(**{field.name: ""})
+            .values_list(field.name, flat=True)
+        )
+        for file_name in queryset.iterator():
+            yield file_name
+            for variation in field.variations.values():
+                yield field.attr_class.get_variation_name(
+                    file_name, variation["name"], variation.get("format")
+                )
+
+    @classmethod
+    def walk(cls, storage, directory):
+        """Yield the names of all files below a storage directory."""
+        try:
+            directories, files = storage.listdir(directory)
+        except FileNotFoundError:
+            return
+        for file_name in files:
+            yield posixpath.join(directory, file_name)
+        for name in directories:
+            if name == FingerprintManifest.location:
+                continue
+            yield from cls.walk(storage, posixpath.join(directory, name))
+
+    @staticmethod
+    def is_old(storage, name, min_age):
+        if not min_age:
+            return True
+        modified = storage.get_modified_time(name)
+        return (timezone.now() - modified).total_seconds() >= min_age
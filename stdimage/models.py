@@ -1,110 +1,1103 @@
+import asyncio
+import functools
 import logging
+import math
 import os
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+import PIL
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile, File
 from django.core.files.storage import default_storage
-from django.db.models import signals
 from django.db.models.fields.files import (
     ImageField,
     ImageFieldFile,
     ImageFileDescriptor,
 )
-from PIL import Image, ImageFile, ImageOps
+from django.db.models.signals import post_delete
+from django.utils.translation import gettext_lazy as _
+from PIL import Image, ImageOps
 
-from .validators import MinSizeValidator
+from . import signals
+from .backends import BaseRenderBackend, LazyRenderBackend
+from .storage import defer_delete, delete_files
+from .validators import MinSizeValidator, get_image_header
 
-logger = logging.getLogger()
+logger = logging.getLogger(__name__)
+
+PILLOW_VERSION = tuple(int(i) for i in PIL.__version__.split(".")[:2])
+
+
+def timed(iterable):
+    """Yield the time it took to produce each item, along with the item."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        yield time.perf_counter() - start, item
+
+
+class VariationSpec(Mapping):
+    """
+    Immutable variation definition, built by :meth:`StdImageField.add_variation`.
+
+    Specs are read-only mappings, nested dicts and lists are frozen too.
+    They can be shared between threads, are hashable and cheap to pickle.
+    """
+
+    __slots__ = ("_keys", "_values", "_hash")
+
+    def __init__(self, variation=(), **kwargs):
+        variation = dict(variation, **kwargs)
+        object.__setattr__(self, "_keys", tuple(variation))
+        object.__setattr__(
+            self, "_values", tuple(self._freeze(v) for v in variation.values())
+        )
+        object.__setattr__(self, "_hash", None)
+
+    @classmethod
+    def _freeze(cls, value):
+        if isinstance(value, Mapping):
+            return value if isinstance(value, cls) else cls(value)
+        if isinstance(value, list):
+            return tuple(cls._freeze(v) for v in value)
+        return value
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._keys.index(key)]
+        except ValueError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __hash__(self):
+        if self._hash is None:
+            try:
+                value = hash((self._keys, self._values))
+            except TypeError:
+                value = hash(repr(self))
+            object.__setattr__(self, "_hash", value)
+        return self._hash
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is immutable." % type(self).__name__)
+
+    __delattr__ = __setattr__
+
+    def __reduce__(self):
+        return type(self), (dict(zip(self._keys, self._values)),)
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, dict(self))
+
+
+class TruncatedJPEGFile:
+    """
+    JPEG file wrapper, that ends truncated files with an end of image marker.
+
+    Pillow only loads truncated images if the process-wide
+    ``ImageFile.LOAD_TRUNCATED_IMAGES`` is set. This does the same
+    for a single JPEG, like Pillow does, without changing global state.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self._ended = False
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+    def read(self, *args):
+        data = self.fp.read(*args)
+        if not data and not self._ended:
+            self._ended = True
+            return b"\xff\xd9"
+        return data
+
+
+class CachedURLMixin:
+    """Look up the file URL in the ``url_cache`` of the field, if it has one."""
+
+    @property
+    def url(self):
+        prefetched_name, url = self.__dict__.get("_prefetched_url", (None, None))
+        if prefetched_name is not None and prefetched_name == self.name:
+            return url
+        url_cache = getattr(self.field, "url_cache", None)
+        if url_cache is None:
+            return super().url
+        self._require_file()
+        return url_cache.get_url(self.storage, self.name)
+
+
+class VariationFieldFile(CachedURLMixin, ImageFieldFile):
+    """
+    File of a variation, like the files of Django's ImageField.
+
+    If the field has a ``metadata_field``, the dimensions and size of the
+    variation are read from the metadata stored at render time, instead of
+    the file.
+    """
+
+    #: Name of the variation.
+    variation = None
+
+    def __init__(self, instance, field, name, variation=None):
+        super().__init__(instance, field, name)
+        self.variation = variation
+
+    @property
+    def metadata(self):
+        """Return the stored metadata of the variation or ``None``."""
+        metadata_field = getattr(self.field, "metadata_field", None)
+        if not metadata_field or self.variation is None:
+            return None
+        metadata = (getattr(self.instance, metadata_field) or {}).get(self.variation)
+        # metadata of a previous file is outdated
+        if metadata and metadata.get("name") == self.name:
+            return metadata
+        return None
+
+    def _get_image_dimensions(self):
+        metadata = self.metadata
+        if metadata is None:
+            return super()._get_image_dimensions()
+        return metadata["width"], metadata["height"]
+
+    @property
+    def size(self):
+        metadata = self.metadata
+        if metadata is None:
+            return super().size
+        return metadata["size"]
+
+
+class LazyVariationFieldFile(ImageFieldFile):
+    """Variation file, that is rendered on demand by the variation view."""
+
+    def __init__(self, instance, field, name, source_name, variation):
+        super().__init__(instance, field, name)
+        self.source_name = source_name
+        self.variation = variation
+
+    @property
+    def url(self):
+        return self.field.render_variations.get_url(
+            self.field, self.source_name, self.variation
+        )
 
 
 class StdImageFileDescriptor(ImageFileDescriptor):
     """The variation property of the field is accessible in instance cases."""
 
-    def __set__(self, instance, value):
-        super().__set__(instance, value)
-        self.field.set_variations(instance)
-
 
-class StdImageFieldFile(ImageFieldFile):
+class StdImageFieldFile(CachedURLMixin, ImageFieldFile):
     """Like ImageFieldFile but handles variations."""
 
+    #: Rendered variations larger than this many bytes are buffered on disk.
+    spool_max_size = 1024 * 1024
+
+    #: Key of the source image dimensions in the ``metadata_field``.
+    source_metadata_key = "_source"
+
+    #: Whether uncompressed images can be decoded in bands, which relies on
+    #: internals of Pillow's ``ImageFile`` of the tested Pillow versions.
+    band_decoding = (7, 0) <= PILLOW_VERSION < (10, 0)
+
+    #: File extensions of variations that are rendered to another format.
+    format_extensions = {
+        "JPEG": ".jpeg",
+        "PNG": ".png",
+        "GIF": ".gif",
+        "WEBP": ".webp",
+        "AVIF": ".avif",
+    }
+
+    #: Default encoder options of variations that are rendered to another format.
+    format_options = {
+        "JPEG": {"optimize": True, "quality": "web_high"},
+        "PNG": {"optimize": True},
+        "WEBP": {"quality": 80, "method": 4},
+        "AVIF": {"quality": 60, "speed": 6},
+    }
+
+    def __getattr__(self, name):
+        """
+        Return the variation file for a variation name.
+
+        Variation files are created lazily on first access and cached
+        for the current file name.
+        """
+        field = self.__dict__.get("field")
+        file_name = self.__dict__.get("name")
+        if (
+            field is None
+            or name not in field.variations
+            or not file_name
+            or not self.__dict__.get("_committed")
+        ):
+            raise AttributeError(
+                "'%s' object has no attribute '%s'" % (type(self).__name__, name)
+            )
+        cache = self.__dict__.setdefault("_variation_files", {})
+        try:
+            return cache[name, file_name]
+        except KeyError:
+            variation = field.variations[name]
+            variation_name = self.get_variation_name(
+                file_name, variation["name"], variation.get("format")
+            )
+            if isinstance(field.render_variations, LazyRenderBackend):
+                variation_file = LazyVariationFieldFile(
+                    self.instance, field, variation_name, file_name, name
+                )
+            else:
+                variation_file = VariationFieldFile(
+                    self.instance, field, variation_name, name
+                )
+            cache[name, file_name] = variation_file
+            return variation_file
+
     def save(self, name, content, save=True):
-        super().save(name, content, save)
         render_variations = self.field.render_variations
+        if isinstance(render_variations, BaseRenderBackend):
+            super().save(name, content, save)
+            render_variations.render(self)
+            return
+        # the instance is saved once, with the metadata of the variations
+        super().save(name, content, save=False)
         if callable(render_variations):
             render_variations = render_variations(
                 file_name=self.name,
                 variations=self.field.variations,
                 storage=self.storage,
             )
+        self.check_render_variations(render_variations)
+        if render_variations:
+            self.render_variations()
+        if save:
+            self.instance.save()
+
+    async def asave(self, name, content, save=True, executor=None):
+        """
+        Save the file and render its variations, without blocking the event loop.
+
+        The async counterpart of :meth:`save`. The file is written and the
+        instance is saved in ``sync_to_async``, variations are rendered by
+        :meth:`arender_variations` in the ``executor``.
+        """
+        render_variations = self.field.render_variations
+        if isinstance(render_variations, BaseRenderBackend):
+            await sync_to_async(super().save)(name, content, save)
+            await sync_to_async(render_variations.render)(self)
+            return
+        await sync_to_async(super().save)(name, content, save=False)
+        if callable(render_variations):
+            render_variations = await sync_to_async(render_variations)(
+                file_name=self.name,
+                variations=self.field.variations,
+                storage=self.storage,
+            )
+        self.check_render_variations(render_variations)
+        if render_variations:
+            await self.arender_variations(executor=executor)
+        if save:
+            await sync_to_async(self.instance.save)()
+
+    @staticmethod
+    def check_render_variations(render_variations):
         if not isinstance(render_variations, bool):
             msg = (
                 '"render_variations" callable expects a boolean return value,'
                 " but got %s"
             ) % type(render_variations)
             raise TypeError(msg)
-        if render_variations:
-            self.render_variations()
 
     @staticmethod
     def is_smaller(img, variation):
-        return img.size[0] > variation["width"] or img.size[1] > variation["height"]
+        return any(
+            limit is not None and length > limit
+            for length, limit in zip(
+                img.size, (variation["width"], variation["height"])
+            )
+        )
+
+    @staticmethod
+    def is_skipped(img, variation):
+        """Return whether a srcset variation is not narrower than the image."""
+        return bool(variation.get("srcset")) and variation["width"] >= img.size[0]
+
+    @staticmethod
+    def get_size(img, variation):
+        """Return the variation size, unbounded sides are the image size."""
+        return tuple(
+            length if limit is None else int(limit)
+            for length, limit in zip(
+                img.size, (variation["width"], variation["height"])
+            )
+        )
+
+    @property
+    def srcset(self):
+        """The ``srcset`` attribute of an ``img`` tag, see :meth:`get_srcset`."""
+        return self.get_srcset()
+
+    def get_srcset(self, file_format=None):
+        """
+        Return the ``srcset`` attribute value of the srcset variations.
+
+        If the source image is narrower than the widest variation, the
+        source image is the widest candidate. The source width is read from
+        the ``width_field`` or the ``metadata_field`` of the field if it has
+        one, otherwise from the image file. The URLs are looked up with a
+        single cache lookup in the ``url_cache`` of the field, if it has one.
+
+        Args:
+            file_format (str): One of the ``formats`` of the field, e.g.
+                ``"WEBP"`` for a ``<source type="image/webp">`` tag.
+                Default: the variations in the source format.
+
+        """
+        self._require_file()
+        source_width = self.get_source_width()
+        candidates = []
+        for width in self.field.srcset:
+            if width >= source_width:
+                if file_format is None:
+                    candidates.append((self, source_width))
+                break
+            name = self.field.srcset_variation_name % width
+            if file_format is not None:
+                name = "%s_%s" % (name, file_format.lower())
+            candidates.append((getattr(self, name), width))
+        urls = self.get_urls([field_file for field_file, _ in candidates])
+        return ", ".join(
+            "%s %dw" % (urls[field_file.name], width)
+            for field_file, width in candidates
+        )
+
+    def get_source_width(self):
+        """Return the width of the image, without reading the file if possible."""
+        width_field = self.field.width_field
+        if width_field and getattr(self.instance, width_field):
+            return getattr(self.instance, width_field)
+        metadata_field = self.field.metadata_field
+        if metadata_field:
+            metadata = (getattr(self.instance, metadata_field) or {}).get(
+                self.source_metadata_key
+            )
+            if metadata and metadata.get("name") == self.name:
+                return metadata["width"]
+        return self.width
+
+    def get_urls(self, field_files):
+        """Return the URLs of the file and its variation files by name."""
+        url_cache = self.field.url_cache
+        if url_cache is None or isinstance(
+            self.field.render_variations, LazyRenderBackend
+        ):
+            return {field_file.name: field_file.url for field_file in field_files}
+        return url_cache.get_many(
+            self.storage, [field_file.name for field_file in field_files]
+        )
 
     def render_variations(self, replace=True):
-        """Render all image variations and saves them to the storage."""
-        for _, variation in self.field.variations.items():
-            self.render_variation(self.name, variation, replace, self.storage)
+        """
+        Render all image variations and saves them to the storage.
+
+        The metadata of the rendered variations is set on the
+        ``metadata_field`` of the instance, if the field has one. The
+        instance is not saved.
+        """
+        metadata = {} if self.field.metadata_field else None
+        self.batch_render_variations(
+            self.name,
+            self.field.variations.values(),
+            replace,
+            self.storage,
+            metadata=metadata,
+            **self.field.get_render_kwargs(),
+        )
+        if metadata is not None:
+            self.set_metadata(metadata)
+
+    async def arender_variations(
+        self, replace=True, executor=None, max_write_workers=8
+    ):
+        """
+        Render all image variations, without blocking the event loop.
+
+        Decoding, resizing and encoding run in the ``executor``, a thread
+        pool, default: the default executor of the event loop. Variations
+        are written to the storage concurrently, by up to
+        ``max_write_workers`` threads. See :meth:`render_variations`.
+        """
+        metadata = {} if self.field.metadata_field else None
+        await asyncio.get_running_loop().run_in_executor(
+            executor,
+            functools.partial(
+                self.batch_render_variations,
+                self.name,
+                list(self.field.variations.values()),
+                replace,
+                self.storage,
+                metadata=metadata,
+                max_write_workers=max_write_workers,
+                **self.field.get_render_kwargs(),
+            ),
+        )
+        if metadata is not None:
+            self.set_metadata(metadata)
+
+    def set_metadata(self, metadata):
+        """
+        Update the ``metadata_field`` of the instance with variation metadata.
+
+        Stored metadata of variations, that have not been rendered again, is
+        kept if it belongs to the current file.
+        """
+        variation_names = {
+            name: self.get_variation_name(
+                self.name, variation["name"], variation.get("format")
+            )
+            for name, variation in self.field.variations.items()
+        }
+        variation_names[self.source_metadata_key] = self.name
+        current = getattr(self.instance, self.field.metadata_field) or {}
+        current = {
+            name: value
+            for name, value in current.items()
+            if name in variation_names and value.get("name") == variation_names[name]
+        }
+        current.update(metadata)
+        setattr(self.instance, self.field.metadata_field, current)
 
     @classmethod
     def render_variation(
-        cls, file_name, variation, replace=True, storage=default_storage
+        cls,
+        file_name,
+        variation,
+        replace=True,
+        storage=default_storage,
+        index=None,
+        cache=None,
+        load_truncated_images=True,
+        max_pixels=None,
     ):
         """Render an image variation and saves it to the storage."""
-        variation_name = cls.get_variation_name(file_name, variation["name"])
+        return cls.batch_render_variations(
+            file_name,
+            [variation],
+            replace,
+            storage,
+            index,
+            cache=cache,
+            load_truncated_images=load_truncated_images,
+            max_pixels=max_pixels,
+        )[0]
+
+    @classmethod
+    def batch_render_variations(
+        cls,
+        file_name,
+        variations,
+        replace=True,
+        storage=default_storage,
+        index=None,
+        cache=None,
+        load_truncated_images=True,
+        metadata=None,
+        max_pixels=None,
+        max_write_workers=None,
+    ):
+        """
+        Render multiple image variations and save them to the storage.
+
+        The source image is read from the storage and decoded only once.
+
+        ``replace`` is either a boolean or a collection of the names of the
+        variations to replace.
+
+        An optional :class:`.StorageIndex` is used instead of asking the
+        storage whether each variation exists. Variations found in an
+        optional :class:`.RenderCache` are not rendered again.
+
+        If ``load_truncated_images`` is set, variations of truncated JPEGs
+        are rendered, the missing part of the image is left gray. Rendering
+        does not change Pillow's process-wide ``LOAD_TRUNCATED_IMAGES``
+        setting, which still applies to truncated images of other formats.
+
+        Srcset variations that are not narrower than the source image are
+        skipped, the source image is used in their place.
+
+        Sources with more than ``max_pixels`` are reduced while they are
+        decoded, to bound the memory used, or rejected with a
+        ``PIL.Image.DecompressionBombError``, see :meth:`load_image`.
+
+        An optional ``metadata`` dict is filled with the ``name``,
+        ``width``, ``height``, ``size`` and ``format`` of each rendered
+        variation, by variation name.
+
+        With ``max_write_workers``, variations are written to the storage
+        concurrently by as many threads, while the next variations are
+        encoded. The ``variation_rendered`` signal is then sent from these
+        threads.
+
+        Returns:
+            list: The variation file names, in the order of ``variations``.
+
+        """
+        variation_names = []
+        pending = []
+        for variation in variations:
+            variation_name = cls.get_variation_name(
+                file_name, variation["name"], variation.get("format")
+            )
+            variation_names.append(variation_name)
+            variation_replace = (
+                replace if isinstance(replace, bool) else variation["name"] in replace
+            )
+            if cls.prepare_variation_name(
+                variation_name, variation_replace, storage, index
+            ):
+                pending.append((variation, variation_name))
+        if not pending:
+            return variation_names
+
+        if not max_write_workers:
+            cls.render_pending_variations(
+                file_name,
+                pending,
+                storage,
+                cls.write_variation,
+                index,
+                cache,
+                load_truncated_images,
+                metadata,
+                max_pixels,
+            )
+            return variation_names
+
+        futures = []
+        with ThreadPoolExecutor(
+            max_write_workers, thread_name_prefix="stdimage"
+        ) as executor:
+
+            def write(file_name, variation_name, content, *args, **kwargs):
+                content.seek(0)
+                content = ContentFile(content.read(), name=variation_name)
+                futures.append(
+                    executor.submit(
+                        cls.write_variation,
+                        file_name,
+                        variation_name,
+                        content,
+                        *args,
+                        **kwargs,
+                    )
+                )
+
+            cls.render_pending_variations(
+                file_name,
+                pending,
+                storage,
+                write,
+                index,
+                cache,
+                load_truncated_images,
+                metadata,
+                max_pixels,
+            )
+        for future in futures:
+            future.result()
+        return variation_names
+
+    @classmethod
+    def render_pending_variations(
+        cls,
+        file_name,
+        pending,
+        storage,
+        write,
+        index=None,
+        cache=None,
+        load_truncated_images=True,
+        metadata=None,
+        max_pixels=None,
+    ):
+        """
+        Render ``(variation, variation_name)`` tuples of a source file.
+
+        Rendered variations are passed to ``write``, with the arguments of
+        :meth:`write_variation`. See :meth:`batch_render_variations`.
+        """
+        start = time.perf_counter()
+        with storage.open(file_name) as f:
+            cache_keys = {}
+            if cache is not None:
+                f = BytesIO(f.read())
+                read = time.perf_counter() - start
+                source_hash = cache.get_source_hash(f.getvalue())
+                for variation, variation_name in list(pending):
+                    key = cache.get_key(source_hash, variation, cls)
+                    content = cache.get(key)
+                    if content is None:
+                        cache_keys[variation_name] = key
+                        continue
+                    content = ContentFile(content, name=variation_name)
+                    if metadata is not None:
+                        content.seek(0)
+                        with Image.open(content) as image:
+                            metadata[variation["name"]] = cls.get_metadata(
+                                variation_name, image.size, image.format, content.size
+                            )
+                    write(
+                        file_name,
+                        variation_name,
+                        content,
+                        storage,
+                        index,
+                        variation=variation,
+                        source_size=None,
+                        size=None,
+                        cached=True,
+                        timings={},
+                    )
+                    pending.remove((variation, variation_name))
+                if not pending:
+                    if metadata is not None:
+                        f.seek(0)
+                        with Image.open(f) as img:
+                            metadata[cls.source_metadata_key] = cls.get_source_metadata(
+                                file_name, img
+                            )
+                    return
+            else:
+                read = time.perf_counter() - start
+
+            decode = time.perf_counter()
+            with Image.open(f) as img:
+                if metadata is not None:
+                    metadata[cls.source_metadata_key] = cls.get_source_metadata(
+                        file_name, img
+                    )
+                if load_truncated_images and img.format == "JPEG":
+                    img.fp = TruncatedJPEGFile(img.fp)
+                pending = [
+                    (variation, variation_name)
+                    for variation, variation_name in pending
+                    if not cls.is_skipped(img, variation)
+                ]
+                if not pending:
+                    return
+                source_size = img.size
+                img = cls.load_image(
+                    img, [variation for variation, _ in pending], max_pixels
+                )
+                signals.source_loaded.send(
+                    sender=cls,
+                    file_name=file_name,
+                    size=source_size,
+                    timings={"read": read, "decode": time.perf_counter() - decode},
+                )
+                variations_by_name = {name: variation for variation, name in pending}
+                for resize, (variation_name, image, save_kargs) in timed(
+                    cls.process_variations(img, pending)
+                ):
+                    with SpooledTemporaryFile(cls.spool_max_size) as file_buffer:
+                        encode = time.perf_counter()
+                        image.save(file_buffer, **save_kargs)
+                        content = File(file_buffer, name=variation_name)
+                        content.size = file_buffer.tell()
+                        encode = time.perf_counter() - encode
+                        if variation_name in cache_keys:
+                            file_buffer.seek(0)
+                            cache.set(cache_keys[variation_name], file_buffer.read())
+                        variation = variations_by_name[variation_name]
+                        if metadata is not None:
+                            metadata[variation["name"]] = cls.get_metadata(
+                                variation_name,
+                                image.size,
+                                save_kargs["format"],
+                                content.size,
+                            )
+                        write(
+                            file_name,
+                            variation_name,
+                            content,
+                            storage,
+                            index,
+                            variation=variation,
+                            source_size=source_size,
+                            size=image.size,
+                            cached=False,
+                            timings={"resize": resize, "encode": encode},
+                        )
+
+    @classmethod
+    def write_variation(
+        cls, file_name, variation_name, content, storage, index=None, **kwargs
+    ):
+        """Save a rendered variation and send the ``variation_rendered`` signal."""
+        write = time.perf_counter()
+        cls.save_variation(variation_name, content, storage, index)
+        kwargs["timings"]["write"] = time.perf_counter() - write
+        signals.variation_rendered.send(
+            sender=cls,
+            file_name=file_name,
+            variation_name=variation_name,
+            file_size=content.size,
+            **kwargs,
+        )
+
+    @staticmethod
+    def get_metadata(variation_name, size, file_format, file_size):
+        """Return the metadata stored for a rendered variation."""
+        return {
+            "name": variation_name,
+            "width": size[0],
+            "height": size[1],
+            "size": file_size,
+            "format": file_format,
+        }
+
+    @staticmethod
+    def get_source_metadata(file_name, img):
+        """Return the metadata stored for the source image."""
+        return {
+            "name": file_name,
+            "width": img.size[0],
+            "height": img.size[1],
+            "format": img.format,
+        }
+
+    @classmethod
+    def load_image(cls, img, variations, max_pixels=None):
+        """
+        Load the source image data to render variations from.
+
+        JPEGs are decoded at the smallest scale (draft mode), that is still
+        at least ``reducing_gap`` times, or twice for exact variations, the
+        size of the largest variation, like ``Image.thumbnail`` does.
+
+        Sources with more than ``max_pixels`` are reduced while they are
+        decoded, see :meth:`load_reduced_image`. The budget is checked
+        against the image header, before anything is decoded.
+
+        Returns:
+            PIL.Image.Image: The loaded image, which may be a reduced copy.
+
+        Raises:
+            PIL.Image.DecompressionBombError: If the source can't be decoded
+                within ``max_pixels``.
+
+        """
+        if max_pixels:
+            factor = cls.get_reduction_factor(img, max_pixels)
+            if factor is None:
+                raise Image.DecompressionBombError(
+                    "Image size (%d pixels) exceeds the limit of %d pixels."
+                    % (img.size[0] * img.size[1], max_pixels)
+                )
+            if factor > 1:
+                return cls.load_reduced_image(img, factor, max_pixels)
+        if variations:
+            scale = max(
+                cls.get_scale(img.size, variation)
+                * (variation.get("reducing_gap") or 2)
+                for variation in variations
+            )
+            img.draft(None, tuple(int(i * scale) for i in img.size))
+        img.load()
+        return img
+
+    @classmethod
+    def get_reduction_factor(cls, img, max_pixels):
+        """
+        Return the factor an opened image is reduced by while it is decoded.
+
+        The reduced image has no more than about ``max_pixels``. Only JPEGs,
+        by up to a factor of 8, and uncompressed images, like BMP or
+        uncompressed TIFF, can be reduced while they are decoded. The latter
+        only with the Pillow versions of :attr:`band_decoding`.
+
+        Returns:
+            int: ``1`` for images within the budget, ``None`` for images
+            that can't be decoded within the budget.
+
+        """
+        width, height = img.size
+        if width * height <= max_pixels:
+            return 1
+        factor = math.ceil(math.sqrt(width * height / max_pixels))
+        while math.ceil(width / factor) * math.ceil(height / factor) > max_pixels:
+            factor += 1
+        if img.format == "JPEG":
+            # JPEGs are scaled by 1/2, 1/4 or 1/8 while decoding
+            factor = 1 << (factor - 1).bit_length()
+            return factor if factor <= 8 else None
+        if (
+            cls.band_decoding
+            and len(img.tile) == 1
+            and img.tile[0][0] == "raw"
+            and img.tile[0][1] == (0, 0, width, height)
+            and img.mode not in ("1", "P")
+            and not getattr(img, "_tile_orientation", None)
+        ):
+            return factor
+        return None
+
+    @staticmethod
+    def load_reduced_image(img, factor, max_pixels):
+        """
+        Decode an opened image reduced by ``factor``, with bounded memory.
+
+        JPEGs are decoded at a reduced scale (draft mode). Uncompressed
+        images are decoded in bands of rows, each band is reduced before
+        the next one is decoded. Neither holds more than about
+        ``max_pixels`` decoded pixels in memory at once.
+        """
+        width, height = img.size
+        if img.format == "JPEG":
+            img.draft(None, (width // factor, height // factor))
+            img.load()
+            return img
+
+        _, _, offset, args = img.tile[0]
+        if isinstance(args, str):
+            args = (args,)
+        rawmode, stride, orientation = (*args, 0, 1)[:3]
+        if not stride:
+            stride = len(Image.new(img.mode, (width, 1)).tobytes("raw", rawmode))
+        band_height = max(factor, max_pixels // width // factor * factor)
+        reduced = Image.new(
+            img.mode, (math.ceil(width / factor), math.ceil(height / factor))
+        )
+        reduced.format = img.format
+        reduced.info = img.info.copy()
+        # the file is released after each load
+        fp = img.fp
+        for top in range(0, height, band_height):
+            bottom = min(top + band_height, height)
+            # bottom-up images, like BMP, store the last row first
+            row = top if orientation > 0 else height - bottom
+            img.tile = [
+                (
+                    "raw",
+                    (0, 0, width, bottom - top),
+                    offset + row * stride,
+                    (rawmode, stride, orientation),
+                )
+            ]
+            img._size = (width, bottom - top)
+            img.fp = fp
+            img.load()
+            reduced.paste(img.reduce(factor), (0, top // factor))
+        return reduced
+
+    @classmethod
+    def process_variations(cls, img, pending):
+        """
+        Process multiple variations of an opened image.
+
+        Each variation is resized from a reduction of the source by a power
+        of two, see :meth:`get_reducing_factor`. Reductions by the same
+        factor are shared by variations. Variations of the same geometry,
+        e.g. the same variation in another format, are only resized once.
+        The entropy focal point, see :meth:`get_focal_point`, is computed
+        once for all variations.
+
+        A variation is rendered from the same pixels, whatever other
+        variations are rendered along with it. Only the draft scale JPEGs
+        are decoded at depends on the largest variation, see
+        :meth:`load_image`.
+
+        Args:
+            img (PIL.Image.Image): The opened source image.
+            pending (list): ``(variation, variation_name)`` tuples.
+
+        Yields:
+            tuple: ``(variation_name, image, save_kargs)`` for each variation.
+
+        """
+        img.load()
+        reductions = {1: img}
+        resized = {}
+        focal_points = {}
+        for variation, variation_name in pending:
+            kwargs = {}
+            if variation["crop"]:
+                focus = variation.get("focus")
+                if focus == "entropy":
+                    if focus not in focal_points:
+                        focal_points[focus] = cls.get_focal_point(img)
+                    kwargs["focal_point"] = focal_points[focus]
+                elif focus:
+                    kwargs["focal_point"] = tuple(focus)
+            geometry = (
+                variation["width"],
+                variation["height"],
+                variation["crop"],
+                variation["resample"],
+                variation.get("reducing_gap"),
+                variation.get("focus"),
+            )
+            base = resized.get(geometry)
+            if base is None and cls.is_smaller(img, variation):
+                factor = cls.get_reducing_factor(
+                    img, cls.get_size(img, variation), variation
+                )
+                if factor not in reductions:
+                    reductions[factor] = img.reduce(factor)
+                base = reductions[factor]
+            # Resizing returns a new image, the base is not changed and
+            # needs no copy.
+            image, save_kargs = cls.process_variation(
+                variation, image=img, base=base, **kwargs
+            )
+            # Images converted to another mode can't be used for variations
+            # in the source format.
+            if image.mode == img.mode:
+                resized.setdefault(geometry, image)
+            yield variation_name, image, save_kargs
+
+    @staticmethod
+    def save_variation(variation_name, content, storage, index=None):
+        """Save the rendered variation file to the storage."""
+        saved_name = storage.save(variation_name, content)
+        if index is not None:
+            index.add(saved_name)
+        return saved_name
+
+    @staticmethod
+    def prepare_variation_name(variation_name, replace, storage, index=None):
+        """Return whether the variation needs to be rendered to the storage."""
+        exists = storage.exists if index is None else index.exists
         file_overwrite = getattr(storage, "file_overwrite", False)
-        if not replace and storage.exists(variation_name):
+        if not replace and exists(variation_name):
             logger.info('File "%s" already exists.', variation_name)
-            return variation_name
-        elif replace and not file_overwrite and storage.exists(variation_name):
+            return False
+        elif replace and not file_overwrite and exists(variation_name):
             logger.warning(
                 'File "%s" already exists and will be overwritten.', variation_name
             )
             storage.delete(variation_name)
+            if index is not None:
+                index.discard(variation_name)
+        return True
 
-        ImageFile.LOAD_TRUNCATED_IMAGES = True
-        with storage.open(file_name) as f:
-            with Image.open(f) as img:
-                img, save_kargs = cls.process_variation(variation, image=img)
-                with BytesIO() as file_buffer:
-                    img.save(file_buffer, **save_kargs)
-                    f = ContentFile(file_buffer.getvalue())
-                    storage.save(variation_name, f)
-        return variation_name
+    @staticmethod
+    def get_scale(size, variation):
+        """Return the scale of a variation relative to the source image size."""
+        ratios = [
+            limit / length
+            for limit, length in zip((variation["width"], variation["height"]), size)
+            if limit is not None
+        ]
+        if not ratios:
+            return 1
+        return min(1, max(ratios) if variation["crop"] else min(ratios))
+
+    @staticmethod
+    def get_focal_point(img, proxy_size=128, grid=8):
+        """
+        Return the focal point of an image, by entropy.
+
+        The image is reduced to a small grayscale proxy, divided into a grid
+        of cells. The focal point is the center of the cells, weighted by
+        the square of how much more detailed each cell is than the plainest.
+        Detailed areas, like faces or products, have a higher entropy than
+        a plain background.
+
+        Returns:
+            tuple: ``(x, y)`` relative to the image size, from 0 to 1.
+
+        """
+        scale = proxy_size / max(img.size)
+        proxy = img.resize(
+            tuple(max(grid, round(length * scale)) for length in img.size),
+            Image.BOX,
+        ).convert("L")
+        width, height = proxy.size
+        cells = [
+            (
+                (i + 0.5) / grid,
+                (j + 0.5) / grid,
+                proxy.crop(
+                    (
+                        i * width // grid,
+                        j * height // grid,
+                        (i + 1) * width // grid,
+                        (j + 1) * height // grid,
+                    )
+                ).entropy(),
+            )
+            for i in range(grid)
+            for j in range(grid)
+        ]
+        plainest = min(entropy for _, _, entropy in cells)
+        weights = [(entropy - plainest) ** 2 for _, _, entropy in cells]
+        total = sum(weights)
+        if not total:
+            return 0.5, 0.5
+        return tuple(
+            sum(cell[axis] * weight for cell, weight in zip(cells, weights)) / total
+            for axis in (0, 1)
+        )
+
+    @staticmethod
+    def get_centering(image_size, size, focal_point):
+        """Return the ``ImageOps.fit`` centering of a crop around a focal point."""
+        width, height = image_size
+        ratio = size[0] / size[1]
+        crop_size = min(width, height * ratio), min(height, width / ratio)
+        return tuple(
+            (
+                0.5
+                if crop_length >= length
+                else min(
+                    max((focus * length - crop_length / 2) / (length - crop_length), 0),
+                    1,
+                )
+            )
+            for length, crop_length, focus in zip(image_size, crop_size, focal_point)
+        )
 
     @classmethod
-    def process_variation(cls, variation, image):
-        """Process variation before actual saving."""
+    def process_variation(cls, variation, image, focal_point=None, base=None):
+        """
+        Process variation before actual saving.
+
+        The size and save options of the variation are based on the source
+        ``image``. It is resized from ``base``, a reduction of the source,
+        if one is given, otherwise from :meth:`reduce_image`. Cropped
+        variations are centered on the ``focal_point``, relative to the
+        image size, if one is given.
+        """
         save_kargs = {}
-        file_format = image.format
+        source_format = image.format
+        file_format = variation.get("format") or source_format
         save_kargs["format"] = file_format
 
-        resample = variation["resample"]
-
         if cls.is_smaller(image, variation):
-            factor = 1
-            while (
-                image.size[0] / factor > 2 * variation["width"]
-                and image.size[1] * 2 / factor > 2 * variation["height"]
-            ):
-                factor *= 2
-            if factor > 1:
-                image.thumbnail(
-                    (int(image.size[0] / factor), int(image.size[1] / factor)),
-                    resample=resample,
-                )
+            size = cls.get_size(image, variation)
 
-            size = variation["width"], variation["height"]
-            size = tuple(int(i) if i is not None else i for i in size)
+            if base is None:
+                base = cls.reduce_image(image, size, variation)
+            image = base
 
             if file_format == "JPEG":
                 # http://stackoverflow.com/a/21669827
@@ -114,17 +1107,127 @@ class StdImageFieldFile(ImageFieldFile):
                 if size[0] * size[1] > 10000:  # roughly <10kb
                     save_kargs["progressive"] = True
 
-            if variation["crop"]:
-                image = ImageOps.fit(image, size, method=resample)
-            else:
-                image.thumbnail(size, resample=resample)
+            image = cls.resize_image(image, size, variation, focal_point)
+
+        if file_format != source_format:
+            image = cls.convert_image(image, file_format)
+            for key, value in cls.format_options.get(file_format, {}).items():
+                save_kargs.setdefault(key, value)
 
         return image, save_kargs
 
     @classmethod
-    def get_variation_name(cls, file_name, variation_name):
-        """Return the variation file name based on the variation."""
+    def resize_image(cls, image, size, variation, focal_point=None):
+        """
+        Resize or crop an image to the variation size.
+
+        The ``reducing_gap`` of the variation is passed to Pillow.
+        Variations with a ``reducing_gap`` of ``None`` are resampled
+        exactly. The image is not changed, a resized copy is returned.
+        """
+        resample = variation["resample"]
+        reducing_gap = variation.get("reducing_gap")
+        if not variation["crop"]:
+            thumbnail_size = cls.get_thumbnail_size(image.size, size)
+            if thumbnail_size == image.size:
+                return image
+            return image.resize(thumbnail_size, resample, reducing_gap=reducing_gap)
+        if image.size == tuple(size):
+            return image
+        centering = (
+            cls.get_centering(image.size, size, focal_point)
+            if focal_point
+            else (0.5, 0.5)
+        )
+        if reducing_gap is None:
+            return ImageOps.fit(image, size, method=resample, centering=centering)
+        # ImageOps.fit resamples exactly
+        return image.resize(
+            size,
+            resample,
+            box=cls.get_crop_box(image.size, size, centering),
+            reducing_gap=reducing_gap,
+        )
+
+    @staticmethod
+    def get_thumbnail_size(image_size, size):
+        """Return the size ``Image.thumbnail`` resizes an image to."""
+        width, height = image_size
+        max_width, max_height = size
+        if max_width >= width and max_height >= height:
+            return image_size
+        aspect = width / height
+        if max_width / max_height >= aspect:
+            return max(round(max_height * aspect), 1), max_height
+        return max_width, max(round(max_width / aspect), 1)
+
+    @staticmethod
+    def get_crop_box(image_size, size, centering):
+        """Return the box ``ImageOps.fit`` crops an image of ``image_size`` to."""
+        width, height = image_size
+        ratio = size[0] / size[1]
+        crop_width, crop_height = min(width, height * ratio), min(height, width / ratio)
+        left = (width - crop_width) * centering[0]
+        top = (height - crop_height) * centering[1]
+        return left, top, left + crop_width, top + crop_height
+
+    @staticmethod
+    def convert_image(image, file_format):
+        """Convert the image to a mode that can be saved in the file format."""
+        if file_format == "JPEG":
+            return image.convert("RGB")
+        if file_format in ("WEBP", "AVIF") and image.mode not in ("RGB", "RGBA"):
+            if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+                return image.convert("RGBA")
+            return image.convert("RGB")
+        return image
+
+    @classmethod
+    def reduce_image(cls, image, size, variation):
+        """
+        Cheaply reduce the image before it is resized to the variation size.
+
+        The image is reduced by the factor of :meth:`get_reducing_factor`.
+        """
+        factor = cls.get_reducing_factor(image, size, variation)
+        return image.reduce(factor) if factor > 1 else image
+
+    @classmethod
+    def get_reducing_factor(cls, image, size, variation):
+        """
+        Return the power of two an image is reduced by, before it is resized.
+
+        The reduced image is at least ``reducing_gap`` times the size the
+        variation is resized to, like Pillow's own ``reducing_gap``. Images
+        are not reduced for variations with a ``reducing_gap`` of ``None``,
+        variations that resample with ``NEAREST`` and palette images.
+        """
+        reducing_gap = variation.get("reducing_gap")
+        if (
+            not reducing_gap
+            or variation["resample"] == Image.NEAREST
+            or image.mode in ("1", "P")
+        ):
+            return 1
+        if not variation["crop"]:
+            size = cls.get_thumbnail_size(image.size, size)
+        ratio = min(length / limit for length, limit in zip(image.size, size))
+        factor = 1
+        while ratio / (factor * 2) >= reducing_gap:
+            factor *= 2
+        return factor
+
+    @classmethod
+    def get_variation_name(cls, file_name, variation_name, file_format=None):
+        """
+        Return the variation file name based on the variation.
+
+        The extension of the source file is kept, unless the variation
+        is rendered to another ``file_format``.
+        """
         path, ext = os.path.splitext(file_name)
+        if file_format:
+            ext = cls.format_extensions.get(file_format, "." + file_format.lower())
         path, file_name = os.path.split(path)
         file_name = "{file_name}.{variation_name}{extension}".format(
             **{
@@ -139,10 +1242,19 @@ class StdImageFieldFile(ImageFieldFile):
         self.delete_variations()
         super().delete(save)
 
+    def get_variation_names(self):
+        """Return the file names of all variations of the file."""
+        return [
+            self.get_variation_name(
+                self.name, variation["name"], variation.get("format")
+            )
+            for variation in self.field.variations.values()
+        ]
+
     def delete_variations(self):
-        for variation in self.field.variations:
-            variation_name = self.get_variation_name(self.name, variation)
-            self.storage.delete(variation_name)
+        # The few files of one instance are deleted serially, thread pools are
+        # left to bulk deletes, see :func:`.deferred_deletes`.
+        delete_files(self.storage, self.get_variation_names(), max_workers=1)
 
 
 class StdImageField(ImageField):
@@ -163,11 +1275,19 @@ class StdImageField(ImageField):
 
     descriptor_class = StdImageFileDescriptor
     attr_class = StdImageFieldFile
+    #: Name of the variations of the ``srcset`` widths.
+    srcset_variation_name = "w%d"
+    max_pixels_message = _(
+        "The image you uploaded is too large."
+        " It may have at most %(max_pixels)s pixels, but has %(pixels)s."
+    )
     def_variation = {
         "width": None,
         "height": None,
         "crop": False,
         "resample": Image.ANTIALIAS,
+        "reducing_gap": 2.0,
+        "format": None,
     }
 
     def __init__(
@@ -178,6 +1298,14 @@ class StdImageField(ImageField):
         render_variations=True,
         force_min_size=False,
         delete_orphans=False,
+        render_cache=None,
+        formats=(),
+        load_truncated_images=True,
+        url_cache=None,
+        srcset=(),
+        metadata_field=None,
+        max_pixels=None,
+        crop_focus=None,
         **kwargs
     ):
         """
@@ -188,23 +1316,65 @@ class StdImageField(ImageField):
             StdImageField(
                 upload_to='PATH',
                 variations={
-                    'thumbnail': {"width", "height", "crop", "resample"},
+                    'thumbnail': {
+                        "width", "height", "crop", "resample", "reducing_gap",
+                        "format", "focus"
+                    },
                 },
+                formats=("WEBP",),
                 delete_orphans=True,
             )
 
         Args:
             variations (dict):
                 Different size variations of the image.
-            render_variations (bool, callable):
+            render_variations (bool, callable, BaseRenderBackend):
                 Boolean or callable that returns a boolean. If True, the built-in
                 image render will be used. The callable gets passed the ``app_name``,
-                ``model``, ``field_name`` and ``pk``. Default: ``True``
+                ``model``, ``field_name`` and ``pk``. A render backend instance,
+                see :mod:`stdimage.backends`, takes over rendering.
+                Default: ``True``
             delete_orphans (bool):
                 If ``True``, files orphaned files will be removed in case a new file
                 is assigned or the field is cleared. This will only remove work for
                 Django forms. If you unassign or reassign a field in code, you will
                 need to remove the orphaned files yourself.
+            render_cache (RenderCache):
+                Optional :class:`.RenderCache`, to avoid rendering variations
+                of identical images more than once.
+            formats (tuple):
+                Additional file formats, e.g. ``("WEBP", "AVIF")``, every
+                variation is rendered to. For each format a variation named
+                ``<variation>_<format>``, e.g. ``thumbnail_webp``, is added.
+                All formats are rendered from a single decode of the source.
+            load_truncated_images (bool):
+                Render variations of truncated JPEGs, instead of raising an
+                error. Other formats follow Pillow's process-wide
+                ``ImageFile.LOAD_TRUNCATED_IMAGES`` setting.
+                Default: ``True``
+            url_cache (URLCache):
+                Optional :class:`.URLCache`, to avoid computing the
+                storage URLs of files and variations on every access.
+            srcset (tuple):
+                Widths, e.g. ``(320, 640, 1280)``, of responsive variations.
+                For each width a variation named ``w<width>``, e.g. ``w320``,
+                is added. Widths not narrower than the uploaded image are not
+                rendered. See :attr:`StdImageFieldFile.srcset`.
+            metadata_field (str):
+                Name of a ``JSONField`` of the model, declared after this
+                field, to store the dimensions, size and format of rendered
+                variations in. Variation files read them from there,
+                instead of the storage.
+            max_pixels (int):
+                Budget of decoded pixels, to bound the memory used for
+                rendering. Larger JPEGs and uncompressed images are reduced
+                while they are decoded, other larger images are rejected by
+                the validation and fail to render.
+            crop_focus (str, tuple):
+                Default ``focus`` of cropped variations. ``"entropy"``
+                centers crops on the most detailed area of the image, an
+                ``(x, y)`` tuple, relative to the image size, on that point.
+                Default: ``None``, crops are centered.
 
         """
         if not variations:
@@ -212,7 +1382,10 @@ class StdImageField(ImageField):
         if not isinstance(variations, dict):
             msg = ('"variations" expects a dict,' " but got %s") % type(variations)
             raise TypeError(msg)
-        if not (isinstance(render_variations, bool) or callable(render_variations)):
+        if not (
+            isinstance(render_variations, (bool, BaseRenderBackend))
+            or callable(render_variations)
+        ):
             msg = (
                 '"render_variations" excepts a boolean or callable,' " but got %s"
             ) % type(render_variations)
@@ -223,14 +1396,39 @@ class StdImageField(ImageField):
         self.render_variations = render_variations
         self.variations = {}
         self.delete_orphans = delete_orphans
+        self.render_cache = render_cache
+        self.load_truncated_images = load_truncated_images
+        self.url_cache = url_cache
+        self.srcset = tuple(sorted(srcset))
+        self.metadata_field = metadata_field
+        self.max_pixels = max_pixels
 
         for nm, prm in list(variations.items()):
             self.add_variation(nm, prm)
 
-        if self.variations and self.force_min_size:
+        if crop_focus:
+            for nm, variation in list(self.variations.items()):
+                if variation["crop"] and not variation.get("focus"):
+                    self.add_variation(nm, dict(variation, focus=crop_focus))
+
+        for width in self.srcset:
+            self.add_variation(
+                self.srcset_variation_name % width, {"width": width, "srcset": True}
+            )
+
+        for nm, variation in list(self.variations.items()):
+            for file_format in formats:
+                self.add_variation(
+                    "%s_%s" % (nm, file_format.lower()),
+                    dict(variation, format=file_format.upper(), kwargs={}),
+                )
+
+        # srcset variations are not rendered for smaller images
+        sized_variations = [v for v in self.variations.values() if not v.get("srcset")]
+        if sized_variations and self.force_min_size:
             self.min_size = (
-                max(self.variations.values(), key=lambda x: x["width"])["width"],
-                max(self.variations.values(), key=lambda x: x["height"])["height"],
+                max(sized_variations, key=lambda x: x["width"])["width"],
+                max(sized_variations, key=lambda x: x["height"])["height"],
             )
 
         super().__init__(verbose_name=verbose_name, name=name, **kwargs)
@@ -243,14 +1441,15 @@ class StdImageField(ImageField):
         else:
             variation.update(params)
         variation["name"] = name
-        self.variations[name] = variation
+        self.variations[name] = VariationSpec(variation)
 
     def set_variations(self, instance=None, **kwargs):
         """
-        Create a "variation" object as attribute of the ImageField instance.
+        Create all "variation" objects of the ImageField instance.
 
-        Variation attribute will be of the same class as the original image, so
-        "path", "url"... properties can be used
+        Variations are created lazily on first access. This method creates
+        them eagerly. Variation attributes will be of the same class as the
+        original image, so "path", "url"... properties can be used.
 
         :param instance: FileField
         """
@@ -258,27 +1457,52 @@ class StdImageField(ImageField):
         if not deferred_field and getattr(instance, self.name):
             field = getattr(instance, self.name)
             if field._committed:
-                for name, variation in list(self.variations.items()):
-                    variation_name = self.attr_class.get_variation_name(
-                        field.name, variation["name"]
-                    )
-                    variation_field = ImageFieldFile(instance, self, variation_name)
-                    setattr(field, name, variation_field)
+                for name in self.variations:
+                    getattr(field, name)
 
     def post_delete_callback(self, sender, instance, **kwargs):
-        getattr(instance, self.name).delete(False)
+        field_file = getattr(instance, self.name)
+        if field_file and defer_delete(
+            field_file.storage, [field_file.name, *field_file.get_variation_names()]
+        ):
+            return
+        field_file.delete(False)
 
     def contribute_to_class(self, cls, name):
         """Generate all operations on specified signals."""
         super().contribute_to_class(cls, name)
-        signals.post_init.connect(self.set_variations, sender=cls)
         if self.delete_orphans:
-            signals.post_delete.connect(self.post_delete_callback, sender=cls)
+            post_delete.connect(self.post_delete_callback, sender=cls)
+
+    def get_render_kwargs(self):
+        """
+        Return the keyword arguments to render variations of the field with.
+
+        See :meth:`.StdImageFieldFile.batch_render_variations`.
+        """
+        return {
+            "cache": self.render_cache,
+            "load_truncated_images": self.load_truncated_images,
+            "max_pixels": self.max_pixels,
+        }
 
     def validate(self, value, model_instance):
         super().validate(value, model_instance)
         if self.force_min_size:
             MinSizeValidator(self.min_size[0], self.min_size[1])(value)
+        if self.max_pixels and value:
+            self.validate_max_pixels(value)
+
+    def validate_max_pixels(self, value):
+        """Validate that the image can be decoded within ``max_pixels``."""
+        img = get_image_header(value)
+        if self.attr_class.get_reduction_factor(img, self.max_pixels) is None:
+            width, height = img.size
+            raise ValidationError(
+                self.max_pixels_message,
+                code="max_pixels",
+                params={"pixels": width * height, "max_pixels": self.max_pixels},
+            )
 
     def save_form_data(self, instance, data):
         if self.delete_orphans and (data is False or data is not None):
@@ -290,40 +1514,23 @@ class StdImageField(ImageField):
 
 class JPEGFieldFile(StdImageFieldFile):
     @classmethod
-    def get_variation_name(cls, file_name, variation_name):
-        path = super().get_variation_name(file_name, variation_name)
-        path, ext = os.path.splitext(path)
-        return "%s.jpeg" % path
+    def get_variation_name(cls, file_name, variation_name, file_format=None):
+        return super().get_variation_name(
+            file_name, variation_name, file_format or "JPEG"
+        )
 
     @classmethod
-    def process_variation(cls, variation, image):
+    def process_variation(cls, variation, image, focal_point=None, base=None):
         """Process variation before actual saving."""
+        if variation.get("format") not in (None, "JPEG"):
+            return super().process_variation(variation, image, focal_point, base)
         save_kargs = {}
         file_format = "JPEG"
         save_kargs["format"] = file_format
 
-        resample = variation["resample"]
-
-        if variation["width"] is None:
-            variation["width"] = image.size[0]
+        size = cls.get_size(image, variation)
 
-        if variation["height"] is None:
-            variation["height"] = image.size[1]
-
-        factor = 1
-        while (
-            image.size[0] / factor > 2 * variation["width"]
-            and image.size[1] * 2 / factor > 2 * variation["height"]
-        ):
-            factor *= 2
-        if factor > 1:
-            image.thumbnail(
-                (int(image.size[0] / factor), int(image.size[1] / factor)),
-                resample=resample,
-            )
-
-        size = variation["width"], variation["height"]
-        size = tuple(int(i) if i is not None else i for i in size)
+        image = cls.reduce_image(image, size, variation) if base is None else base
 
         # http://stackoverflow.com/a/21669827
         image = image.convert("RGB")
@@ -332,10 +1539,7 @@ class JPEGFieldFile(StdImageFieldFile):
         if size[0] * size[1] > 10000:  # roughly <10kb
             save_kargs["progressive"] = True
 
-        if variation["crop"]:
-            image = ImageOps.fit(image, size, method=resample)
-        else:
-            image.thumbnail(size, resample=resample)
+        image = cls.resize_image(image, size, variation, focal_point)
 
         save_kargs.update(variation["kwargs"])
 
@@ -0,0 +1,15 @@
+from django.dispatch import Signal
+
+#: Sent when a source image has been read and decoded to render variations.
+#: Arguments: ``file_name``, ``size`` of the decoded image and ``timings``,
+#: a dict of the ``read`` and ``decode`` durations in seconds.
+#: ``decode`` includes reading image data, that a storage streams on demand.
+source_loaded = Signal()
+
+#: Sent when a variation has been rendered and saved to the storage.
+#: Arguments: ``file_name``, ``variation_name``, ``variation``, ``source_size``,
+#: ``size`` and ``file_size`` of the variation, ``cached`` and ``timings``,
+#: a dict of the ``resize``, ``encode`` and ``write`` durations in seconds.
+#: Variations copied from a render cache have a ``source_size`` of ``None``
+#: and are only timed for ``write``.
+variation_rendered = Signal()
@@ -0,0 +1,118 @@
+import threading
+
+from . import signals
+
+STAGES = ("resize", "encode", "write")
+
+
+class RenderStats:
+    """
+    Collect render durations and sizes, sent by the render signals.
+
+    Usage::
+
+        with RenderStats() as stats:
+            instance.image.render_variations()
+        print(stats.format_table())
+
+    """
+
+    def __init__(self):
+        self.sources = 0
+        self.source_pixels = 0
+        self.timings = {"read": 0.0, "decode": 0.0}
+        self.variations = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        signals.source_loaded.connect(self.source_loaded, weak=False)
+        signals.variation_rendered.connect(self.variation_rendered, weak=False)
+        return self
+
+    def __exit__(self, *exc_info):
+        signals.source_loaded.disconnect(self.source_loaded)
+        signals.variation_rendered.disconnect(self.variation_rendered)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def source_loaded(self, size, timings, **kwargs):
+        with self._lock:
+            self.sources += 1
+            self.source_pixels += size[0] * size[1]
+            for stage, duration in timings.items():
+                self.timings[stage] += duration
+
+    def variation_rendered(self, variation, size, file_size, cached, timings, **kwargs):
+        with self._lock:
+            stats = self.variations.setdefault(
+                variation["name"],
+                dict(
+                    count=0, cached=0, pixels=0, bytes=0, **dict.fromkeys(STAGES, 0.0)
+                ),
+            )
+            stats["count"] += 1
+            stats["cached"] += cached
+            stats["bytes"] += file_size
+            if size is not None:
+                stats["pixels"] += size[0] * size[1]
+            for stage, duration in timings.items():
+                stats[stage] += duration
+
+    def merge(self, other):
+        """Add the statistics of another instance, e.g. from a worker process."""
+        with self._lock:
+            self.sources += other.sources
+            self.source_pixels += other.source_pixels
+            for stage, duration in other.timings.items():
+                self.timings[stage] += duration
+            for name, other_stats in other.variations.items():
+                stats = self.variations.setdefault(name, dict.fromkeys(other_stats, 0))
+                for key, value in other_stats.items():
+                    stats[key] += value
+
+    def get_rows(self):
+        """Return a header and rows of average durations in ms and sizes."""
+        header = ("variation", "count", "cached", "pixels", "bytes", *STAGES)
+        rows = []
+        for name, stats in sorted(self.variations.items()):
+            count = stats["count"] or 1
+            rendered = (stats["count"] - stats["cached"]) or 1
+            rows.append(
+                (
+                    name,
+                    stats["count"],
+                    stats["cached"],
+                    stats["pixels"] // rendered,
+                    stats["bytes"] // count,
+                    *("%.1f" % (stats[stage] * 1000 / count) for stage in STAGES),
+                )
+            )
+        sources = self.sources or 1
+        rows.append(
+            (
+                "(source)",
+                self.sources,
+                "",
+                self.source_pixels // sources,
+                "",
+                "read %.1f" % (self.timings["read"] * 1000 / sources),
+                "decode %.1f" % (self.timings["decode"] * 1000 / sources),
+                "",
+            )
+        )
+        return header, rows
+
+    def format_table(self):
+        header, rows = self.get_rows()
+        widths = [max(len(str(c)) for c in column) for column in zip(header, *rows)]
+        return "\n".join(
+            "  ".join(str(c).rjust(w) for c, w in zip(row, widths))
+            for row in [header, *rows]
+        )
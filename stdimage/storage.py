@@ -0,0 +1,120 @@
+import contextlib
+import itertools
+import posixpath
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+_deferred = threading.local()
+
+
+class StorageIndex:
+    """
+    Index of existing files, to avoid a storage round trip per file.
+
+    Each directory is listed only once, using ``storage.listdir``. Files
+    saved or deleted through the index are kept up to date. Files changed
+    by other processes after a directory was listed are not, so an index
+    should only be used for the duration of a bulk operation.
+
+    Up to ``max_directories`` directory listings are cached, the least
+    recently used listing is discarded first.
+    """
+
+    def __init__(self, storage, max_directories=1024):
+        self.storage = storage
+        self.max_directories = max_directories
+        self._directories = OrderedDict()
+        self._lock = threading.Lock()
+
+    def listdir(self, directory):
+        """Return the set of file names in a directory."""
+        with self._lock:
+            try:
+                self._directories.move_to_end(directory)
+                return self._directories[directory]
+            except KeyError:
+                pass
+        try:
+            _, files = self.storage.listdir(directory)
+        except FileNotFoundError:
+            files = []
+        files = set(files)
+        with self._lock:
+            files = self._directories.setdefault(directory, files)
+            while len(self._directories) > self.max_directories:
+                self._directories.popitem(last=False)
+        return files
+
+    def exists(self, name):
+        directory, file_name = posixpath.split(name)
+        return file_name in self.listdir(directory)
+
+    def add(self, name):
+        directory, file_name = posixpath.split(name)
+        self.listdir(directory).add(file_name)
+
+    def discard(self, name):
+        directory, file_name = posixpath.split(name)
+        self.listdir(directory).discard(file_name)
+
+
+def delete_files(storage, names, max_workers=8, batch_size=1000):
+    """
+    Delete many files from a storage.
+
+    Storages that implement a ``delete_many(names)`` method, e.g. using the
+    bulk delete API of an object store, are passed batches of up to
+    ``batch_size`` names. Otherwise, files are deleted by a pool of up to
+    ``max_workers`` threads. ``names`` may be any iterable, it is consumed
+    one batch at a time.
+    """
+    names = iter(names)
+    delete_many = getattr(storage, "delete_many", None)
+    with contextlib.ExitStack() as stack:
+        pool = None
+        for batch in iter(lambda: list(itertools.islice(names, batch_size)), []):
+            batch = list(dict.fromkeys(batch))
+            if delete_many is not None:
+                delete_many(batch)
+            elif max_workers == 1 or len(batch) == 1:
+                for name in batch:
+                    storage.delete(name)
+            else:
+                if pool is None:
+                    pool = stack.enter_context(ThreadPoolExecutor(max_workers))
+                list(pool.map(storage.delete, batch))
+
+
+@contextlib.contextmanager
+def deferred_deletes(max_workers=8, batch_size=1000):
+    """
+    Collect the files of deleted objects and delete them in bulk on exit.
+
+    Files of fields with ``delete_orphans`` are otherwise deleted one by one,
+    as each object is deleted. Usage::
+
+        with deferred_deletes():
+            MyModel.objects.filter(...).delete()
+
+    No files are deleted if the block raises an exception.
+    """
+    if getattr(_deferred, "files", None) is not None:
+        yield
+        return
+    _deferred.files = files = {}
+    try:
+        yield
+    finally:
+        _deferred.files = None
+    for storage, names in files.items():
+        delete_files(storage, names, max_workers, batch_size)
+
+
+def defer_delete(storage, names):
+    """Return whether the files were collected by :func:`deferred_deletes`."""
+    files = getattr(_deferred, "files", None)
+    if files is None:
+        return False
+    files.setdefault(storage, []).extend(names)
+    return True
@@ -0,0 +1,13 @@
+from django.urls import path
+
+from . import views
+
+app_name = "stdimage"
+
+urlpatterns = [
+    path(
+        "<str:signature>/<str:field_path>/<str:variation>/<path:file_name>",
+        views.variation,
+        name="variation",
+    ),
+]
@@ -1,6 +1,11 @@
+import asyncio
+import functools
+
 from django.core.files.storage import default_storage
 
+from .backends import LazyRenderBackend
 from .models import StdImageFieldFile
+from .storage import delete_files
 
 
 def render_variations(
@@ -9,7 +14,130 @@ def render_variations(
     replace=False,
     storage=default_storage,
     field_class=StdImageFieldFile,
+    index=None,
+    cache=None,
+    load_truncated_images=True,
+    max_pixels=None,
+    max_write_workers=None,
+):
+    """
+    Render all variations for a given field.
+
+    ``replace`` is either a boolean or a collection of the names of the
+    variations to replace. The keyword arguments of a field's
+    :meth:`.StdImageField.get_render_kwargs` may be passed along.
+    """
+    field_class.batch_render_variations(
+        file_name,
+        variations.values(),
+        replace,
+        storage,
+        index,
+        cache=cache,
+        load_truncated_images=load_truncated_images,
+        max_pixels=max_pixels,
+        max_write_workers=max_write_workers,
+    )
+
+
+async def arender_variations(
+    file_name,
+    variations,
+    replace=False,
+    storage=default_storage,
+    field_class=StdImageFieldFile,
+    index=None,
+    cache=None,
+    load_truncated_images=True,
+    max_pixels=None,
+    executor=None,
+    max_write_workers=8,
 ):
-    """Render all variations for a given field."""
-    for key, variation in variations.items():
-        field_class.render_variation(file_name, variation, replace, storage)
+    """
+    Render all variations for a given field, without blocking the event loop.
+
+    The async counterpart of :func:`render_variations`. Rendering runs in
+    the ``executor``, a thread pool, default: the default executor of the
+    event loop. Variations are written concurrently, by up to
+    ``max_write_workers`` threads.
+    """
+    await asyncio.get_running_loop().run_in_executor(
+        executor,
+        functools.partial(
+            render_variations,
+            file_name,
+            variations,
+            replace,
+            storage,
+            field_class,
+            index,
+            cache,
+            load_truncated_images,
+            max_pixels,
+            max_write_workers,
+        ),
+    )
+
+
+def delete_variations(
+    file_names,
+    variations,
+    storage=default_storage,
+    field_class=StdImageFieldFile,
+    max_workers=8,
+):
+    """Delete all variations of many files, see :func:`.delete_files`."""
+    delete_files(
+        storage,
+        (
+            field_class.get_variation_name(
+                file_name, variation["name"], variation.get("format")
+            )
+            for file_name in file_names
+            for variation in variations.values()
+        ),
+        max_workers,
+    )
+
+
+def prefetch_variation_urls(objects, field_name, variations=None, url_cache=None):
+    """
+    Prefetch the URLs of variations of many objects, e.g. for a list page.
+
+    The URLs are looked up with a single cache lookup in the ``url_cache``
+    of the field. Objects may be a queryset, it is evaluated.
+
+    Args:
+        objects: Model instances or a queryset.
+        field_name (str): The name of the :class:`.StdImageField`.
+        variations (list): Names of the variations, default: all.
+        url_cache (URLCache): Default: the ``url_cache`` of the field.
+
+    Returns:
+        list: The objects.
+
+    """
+    objects = list(objects)
+    if not objects:
+        return objects
+    field = objects[0]._meta.get_field(field_name)
+    if isinstance(field.render_variations, LazyRenderBackend):
+        # URLs of the render view do not require a storage call
+        return objects
+    url_cache = url_cache or field.url_cache
+    if variations is None:
+        variations = list(field.variations)
+    files = [
+        getattr(field_file, variation)
+        for field_file in (getattr(obj, field_name) for obj in objects)
+        if field_file
+        for variation in variations
+    ]
+    names = {variation_file.name for variation_file in files}
+    if url_cache is None:
+        urls = {name: field.storage.url(name) for name in names}
+    else:
+        urls = url_cache.get_many(field.storage, names)
+    for variation_file in files:
+        variation_file._prefetched_url = variation_file.name, urls[variation_file.name]
+    return objects
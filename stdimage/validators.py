@@ -1,11 +1,46 @@
-from io import BytesIO
-
 from django.core.exceptions import ValidationError
 from django.core.validators import BaseValidator
 from django.utils.translation import gettext_lazy as _
 from PIL import Image
 
 
+def get_image_header(value):
+    """
+    Return the image of a file, with only its header read.
+
+    The image is closed, its pixel data can't be loaded. It is cached on
+    the file object, so all checks of an upload share a single probe.
+    """
+    try:
+        return value._image_header_cache
+    except AttributeError:
+        pass
+    value.seek(0)
+    with Image.open(value) as img:
+        pass
+    value.seek(0)
+    value._image_header_cache = img
+    return img
+
+
+def get_image_size(value):
+    """
+    Return the width and height of an image file.
+
+    Only the image header is read, the file is not copied into memory.
+    The size is cached on the file object in the same attribute Django's
+    ``ImageFile`` uses for its dimensions. All validators and the field's
+    own ``width`` and ``height`` therefore share a single probe.
+    """
+    try:
+        return value._dimensions_cache
+    except AttributeError:
+        pass
+    size = get_image_header(value).size
+    value._dimensions_cache = size
+    return size
+
+
 class BaseSizeValidator(BaseValidator):
     """Base validator that validates the size of an image."""
 
@@ -26,11 +61,7 @@ class BaseSizeValidator(BaseValidator):
 
     @staticmethod
     def clean(value):
-        value.seek(0)
-        stream = BytesIO(value.read())
-        size = Image.open(stream).size
-        value.seek(0)
-        return size
+        return get_image_size(value)
 
 
 class MaxSizeValidator(BaseSizeValidator):
@@ -0,0 +1,107 @@
+import hashlib
+import mimetypes
+import time
+
+from django.apps import apps
+from django.core.cache import caches
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+
+from .backends import LazyRenderBackend
+
+
+def get_field(field_path):
+    try:
+        app_label, model_name, field_name = field_path.rsplit(".", 2)
+        model_class = apps.get_model(app_label, model_name)
+        return model_class._meta.get_field(field_name)
+    except (ValueError, LookupError):
+        raise Http404("Unknown field.")
+
+
+def get_validators(storage, name):
+    """
+    Return the ETag and last modified timestamp of a stored file.
+
+    Both are derived from the modification time and size of the file,
+    without reading it. Storages that don't support modification times
+    have no validators.
+    """
+    try:
+        modified_time = storage.get_modified_time(name)
+    except NotImplementedError:
+        return None, None
+    timestamp = modified_time.timestamp()
+    etag = '"%x-%x"' % (int(timestamp * 1000000), storage.size(name))
+    return etag, int(timestamp)
+
+
+def variation(request, signature, field_path, variation, file_name):
+    """
+    Serve a variation, rendering it on the first request.
+
+    Only variations of fields with a :class:`.LazyRenderBackend` are served.
+    """
+    expected = LazyRenderBackend.get_signature(field_path, variation, file_name)
+    if not constant_time_compare(signature, expected):
+        raise Http404("Invalid signature.")
+    field = get_field(field_path)
+    backend = getattr(field, "render_variations", None)
+    if not isinstance(backend, LazyRenderBackend) or variation not in field.variations:
+        raise Http404("Unknown variation.")
+
+    spec = field.variations[variation]
+    storage = field.storage
+    variation_name = field.attr_class.get_variation_name(
+        file_name, spec["name"], spec.get("format")
+    )
+    cache = caches[backend.cache_alias]
+    lock_key = (
+        "stdimage:render:%s" % hashlib.sha256(variation_name.encode()).hexdigest()
+    )
+    deadline = time.monotonic() + backend.lock_timeout
+    while not storage.exists(variation_name):
+        # only one request renders a variation, the others wait for it
+        if cache.add(lock_key, True, backend.lock_timeout):
+            try:
+                field.attr_class.render_variation(
+                    file_name,
+                    spec,
+                    replace=False,
+                    storage=storage,
+                    **field.get_render_kwargs(),
+                )
+            except FileNotFoundError:
+                raise Http404("Source file not found.")
+            finally:
+                cache.delete(lock_key)
+            if not storage.exists(variation_name):
+                # srcset variations are not rendered for narrower sources
+                raise Http404("Variation not rendered.")
+            break
+        if time.monotonic() > deadline:
+            response = HttpResponse("Variation is being rendered.", status=503)
+            response["Retry-After"] = 1
+            return response
+        time.sleep(0.1)
+
+    if backend.redirect:
+        response = HttpResponseRedirect(storage.url(variation_name))
+        patch_cache_control(response, public=True, max_age=backend.max_age)
+        return response
+
+    etag, last_modified = get_validators(storage, variation_name)
+    # conditional requests are answered before the file is opened
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(
+            storage.open(variation_name),
+            content_type=mimetypes.guess_type(variation_name)[0],
+        )
+    if etag is not None:
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, public=True, max_age=backend.max_age)
+    return response
@@ -18,3 +18,23 @@ def imagedata():
 @pytest.fixture
 def image_upload_file(imagedata):
     return SimpleUploadedFile("image.jpg", imagedata.getvalue())
+
+
+@pytest.fixture
+def make_image():
+    """Return a factory of encoded gradient images of any size and format."""
+
+    def _make_image(size, file_format="JPEG", mode="RGB", fill=128, **kwargs):
+        img = Image.merge(
+            "RGB",
+            [
+                Image.linear_gradient("L").resize(size),
+                Image.radial_gradient("L").resize(size),
+                Image.new("L", size, fill),
+            ],
+        ).convert(mode)
+        with io.BytesIO() as f:
+            img.save(f, format=file_format, **kwargs)
+            return f.getvalue()
+
+    return _make_image
@@ -6,9 +6,17 @@ from django.db import models
 from PIL import Image
 
 from stdimage import JPEGField, StdImageField
+from stdimage.backends import (
+    DatabaseRenderBackend,
+    InlineRenderBackend,
+    LazyRenderBackend,
+    ThreadPoolRenderBackend,
+)
+from stdimage.cache import RenderCache, URLCache
 from stdimage.models import StdImageFieldFile
 from stdimage.utils import render_variations
 from stdimage.validators import MaxSizeValidator, MinSizeValidator
+from tests.storage import CountingFileSystemStorage
 
 upload_to = "img/"
 
@@ -65,6 +73,45 @@ class ResizeCropModel(models.Model):
     )
 
 
+class ReducingGapModel(models.Model):
+    """resizes image using fast reduction and draft mode decoding"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={
+            "thumbnail": {"width": 100, "height": 75, "reducing_gap": 2.0},
+            "square": {"width": 50, "height": 50, "crop": True, "reducing_gap": 2.0},
+        },
+    )
+
+
+class ExactModel(models.Model):
+    """resamples image exactly, without reducing it first"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={
+            "thumbnail": {"width": 100, "height": 75, "reducing_gap": None},
+            "square": {"width": 50, "height": 50, "crop": True, "reducing_gap": None},
+        },
+    )
+
+
+class FormatsModel(models.Model):
+    """renders WebP siblings of all variations and a PNG variation"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={
+            "thumbnail": (100, 75),
+            "square": (50, 50, True),
+            "lossless": {"width": 100, "height": 100, "format": "PNG"},
+        },
+        formats=("WEBP",),
+        delete_orphans=True,
+    )
+
+
 class ThumbnailModel(models.Model):
     """creates a thumbnail resized to maximum size to fit a 100x75 area"""
 
@@ -139,6 +186,50 @@ class MyStorageModel(CustomManagerModel):
     )
 
 
+class CountingStorageModel(models.Model):
+    """stores images in a storage that counts round trips"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={"medium": (400, 400), "thumbnail": (100, 75)},
+        storage=CountingFileSystemStorage(),
+    )
+
+
+class RenderCacheModel(models.Model):
+    """reuses rendered variations of identical images"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={"medium": (400, 400), "thumbnail": (100, 75, True)},
+        render_cache=RenderCache(),
+    )
+
+
+class URLCacheModel(models.Model):
+    """caches the URLs of a storage that counts URL calls"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={"medium": (400, 400), "thumbnail": (100, 75)},
+        storage=CountingFileSystemStorage(),
+        url_cache=URLCache(timeout=60),
+    )
+
+
+class SrcsetURLCacheModel(models.Model):
+    """reads the srcset of cached URLs and stored metadata"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        srcset=(100, 200, 800),
+        storage=CountingFileSystemStorage(),
+        url_cache=URLCache(timeout=60),
+        metadata_field="image_metadata",
+    )
+    image_metadata = models.JSONField(null=True, editable=False)
+
+
 def render_job(**kwargs):
     render_variations(**kwargs)
     return False
@@ -193,3 +284,91 @@ class CustomRenderVariationsModel(models.Model):
         variations={"thumbnail": (150, 150)},
         render_variations=custom_render_variations,
     )
+
+
+class InlineBackendModel(models.Model):
+    """renders variations inline using a render backend"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={"thumbnail": (100, 75)},
+        render_variations=InlineRenderBackend(),
+    )
+
+
+class ThreadPoolBackendModel(models.Model):
+    """renders variations in a thread pool"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={"thumbnail": (100, 75)},
+        render_variations=ThreadPoolRenderBackend(max_workers=2, max_queue_size=2),
+    )
+
+
+class DatabaseBackendModel(models.Model):
+    """queues variations to be rendered by a worker"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={"medium": (400, 400), "thumbnail": (100, 75)},
+        render_variations=DatabaseRenderBackend(),
+    )
+
+
+class LazyBackendModel(models.Model):
+    """renders variations on their first request"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={"thumbnail": (100, 75)},
+        render_variations=LazyRenderBackend(),
+    )
+
+
+class SrcsetModel(models.Model):
+    """renders a width ladder in the source format and WebP"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        srcset=(800, 100, 400, 200),
+        formats=("WEBP",),
+        width_field="image_width",
+    )
+    image_width = models.PositiveIntegerField(null=True, editable=False)
+
+
+class FocusModel(models.Model):
+    """centers crops on the most detailed area of the image"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={
+            "square": (100, 100, True),
+            "top": {"width": 100, "height": 100, "crop": True, "focus": (0.5, 0)},
+            "thumbnail": (100, 75),
+        },
+        formats=("WEBP",),
+        crop_focus="entropy",
+    )
+
+
+class MetadataModel(models.Model):
+    """stores the metadata of rendered variations"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={"thumbnail": (100, 75), "square": (50, 50, True)},
+        metadata_field="image_metadata",
+    )
+    image_metadata = models.JSONField(null=True, editable=False)
+
+
+class LazyRedirectModel(models.Model):
+    """redirects to the storage URL of variations rendered on demand"""
+
+    image = StdImageField(
+        upload_to=upload_to,
+        variations={"thumbnail": (100, 75)},
+        render_variations=LazyRenderBackend(redirect=True),
+    )
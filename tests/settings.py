@@ -20,6 +20,7 @@ INSTALLED_APPS = (
     "django.contrib.sessions",
     "django.contrib.sites",
     "stdimage",
+    "stdimage.jobs",
     "tests",
 )
 
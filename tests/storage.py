@@ -3,3 +3,45 @@ from django.core.files.storage import FileSystemStorage
 
 class MyFileSystemStorage(FileSystemStorage):
     pass
+
+
+class CountingFileSystemStorage(FileSystemStorage):
+    """Count storage calls, like network round trips on a remote storage."""
+
+    calls = {}
+
+    @classmethod
+    def reset(cls):
+        cls.calls.clear()
+
+    def _count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def exists(self, name):
+        self._count("exists")
+        return super().exists(name)
+
+    def listdir(self, path):
+        self._count("listdir")
+        return super().listdir(path)
+
+    def delete(self, name):
+        self._count("delete")
+        return super().delete(name)
+
+    def url(self, name):
+        self._count("url")
+        return super().url(name)
+
+
+class BulkDeleteFileSystemStorage(FileSystemStorage):
+    """Record batches passed to a native bulk delete method."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    def delete_many(self, names):
+        self.batches.append(names)
+        for name in names:
+            self.delete(name)
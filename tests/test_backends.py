@@ -0,0 +1,228 @@
+import datetime
+import os
+import threading
+import time
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+from django.utils import timezone
+
+from stdimage.backends import BaseRenderBackend
+from stdimage.jobs.management.commands.stdimage_worker import Command
+from stdimage.jobs.models import RenderJob
+from stdimage.models import StdImageFieldFile
+from tests.models import (
+    DatabaseBackendModel,
+    InlineBackendModel,
+    LazyBackendModel,
+    LazyRedirectModel,
+    ThreadPoolBackendModel,
+)
+from tests.test_models import IMG_DIR, TestStdImage
+
+
+class TestBaseRenderBackend:
+    def test_render(self):
+        with pytest.raises(NotImplementedError):
+            BaseRenderBackend().render(None)
+
+
+class TestInlineRenderBackend(TestStdImage):
+    def test_render(self, db):
+        obj = InlineBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+        assert os.path.exists(obj.image.thumbnail.path)
+
+
+class TestThreadPoolRenderBackend(TestStdImage):
+    def test_render(self, db):
+        objs = [
+            ThreadPoolBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+            for _ in range(5)
+        ]
+        backend = ThreadPoolBackendModel._meta.get_field("image").render_variations
+        backend.shutdown()
+        assert all(os.path.exists(obj.image.thumbnail.path) for obj in objs)
+
+    def test_render__error(self, db, caplog):
+        backend = ThreadPoolBackendModel._meta.get_field("image").render_variations
+        obj = ThreadPoolBackendModel(image="img/missing.jpg")
+        backend.render(obj.image).exception()
+        backend.shutdown()
+        assert "Rendering variations failed." in caplog.text
+
+
+class TestDatabaseRenderBackend(TestStdImage):
+    def test_render(self, db):
+        obj = DatabaseBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+        assert not os.path.exists(os.path.join(IMG_DIR, "600x400.thumbnail.jpg"))
+        assert RenderJob.objects.count() == 2
+        job = RenderJob.objects.get(variation="thumbnail")
+        assert job.field_path == "tests.DatabaseBackendModel.image"
+        assert str(job) == "img/600x400.jpg: thumbnail"
+
+        # jobs are deduplicated per file and variation
+        obj.image.field.render_variations.render(obj.image)
+        assert RenderJob.objects.count() == 2
+
+        call_command("stdimage_worker", burst=True)
+        assert not RenderJob.objects.exists()
+        assert os.path.exists(obj.image.thumbnail.path)
+        assert os.path.exists(obj.image.medium.path)
+
+    def test_worker__missing(self, db):
+        obj = DatabaseBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+        os.remove(obj.image.path)
+        call_command("stdimage_worker", burst=True)
+        assert not RenderJob.objects.exists()
+
+    def test_worker__error(self, db, monkeypatch):
+        DatabaseBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+
+        def _render(*args, **kwargs):
+            raise OSError("broken")
+
+        monkeypatch.setattr(
+            DatabaseBackendModel.image.field.attr_class,
+            "batch_render_variations",
+            _render,
+        )
+        call_command("stdimage_worker", burst=True, max_attempts=2)
+        assert list(RenderJob.objects.values_list("attempts", flat=True)) == [2, 2]
+
+    def test_worker__claim(self, db, monkeypatch):
+        DatabaseBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+        claims = []
+        render = Command.render
+
+        def _render(*args, **kwargs):
+            # jobs are claimed before rendering, so no other worker takes them
+            claims.extend(RenderJob.objects.values_list("attempts", "claimed"))
+            return render(*args, **kwargs)
+
+        monkeypatch.setattr(Command, "render", staticmethod(_render))
+        call_command("stdimage_worker", burst=True)
+        assert [attempts for attempts, _ in claims] == [1, 1]
+        assert all(claimed for _, claimed in claims)
+        assert not RenderJob.objects.exists()
+
+    def test_worker__timeout(self, db):
+        DatabaseBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+        RenderJob.objects.filter(variation="thumbnail").update(
+            claimed=timezone.now() - datetime.timedelta(hours=2), attempts=1
+        )
+        RenderJob.objects.filter(variation="medium").update(
+            claimed=timezone.now(), attempts=1
+        )
+        call_command("stdimage_worker", burst=True)
+        # the job of a crashed worker is retried, the other one is still claimed
+        assert list(RenderJob.objects.values_list("variation", flat=True)) == ["medium"]
+
+    def test_worker__sleep(self, db, monkeypatch):
+        calls = []
+
+        def _sleep(seconds):
+            calls.append(seconds)
+            if len(calls) > 1:
+                raise KeyboardInterrupt
+
+        monkeypatch.setattr("time.sleep", _sleep)
+        with pytest.raises(KeyboardInterrupt):
+            call_command("stdimage_worker", sleep=0.5)
+        assert calls == [0.5, 0.5]
+
+    def test_rendervariations(self, db):
+        obj = DatabaseBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+        call_command("rendervariations", "tests.DatabaseBackendModel.image")
+        assert os.path.exists(obj.image.thumbnail.path)
+
+
+class TestLazyRenderBackend(TestStdImage):
+    def test_render(self, db, client, monkeypatch):
+        obj = LazyBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+        path = obj.image.thumbnail.path
+        assert not os.path.exists(path)
+        url = obj.image.thumbnail.url
+        assert url.startswith("/stdimage/")
+        assert url.endswith("/tests.lazybackendmodel.image/thumbnail/img/600x400.jpg")
+
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response["Content-Type"] == "image/jpeg"
+        assert response["Cache-Control"] == "public, max-age=86400"
+        assert os.path.exists(path)
+        with open(path, "rb") as f:
+            assert response.getvalue() == f.read()
+        response.close()
+
+        def _open(*args, **kwargs):
+            raise AssertionError("The file must not be opened.")
+
+        monkeypatch.setattr(obj.image.storage, "open", _open)
+        etag = response["ETag"]
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+        assert response["Cache-Control"] == "public, max-age=86400"
+
+    def test_render__invalid_signature(self, db, client):
+        obj = LazyBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+        url = obj.image.thumbnail.url.replace("/tests.", "x/tests.", 1)
+        assert client.get(url).status_code == 404
+
+    def test_render__missing_source(self, db, client):
+        obj = LazyBackendModel(image="img/missing.jpg")
+        assert client.get(obj.image.thumbnail.url).status_code == 404
+
+    def test_render__redirect(self, db, client):
+        obj = LazyRedirectModel.objects.create(image=self.fixtures["600x400.jpg"])
+        response = client.get(obj.image.thumbnail.url)
+        assert response.status_code == 302
+        assert response["Location"] == "/img/600x400.thumbnail.jpg"
+        assert os.path.exists(obj.image.thumbnail.path)
+
+    def test_render__field_kwargs(self, db, monkeypatch):
+        obj = LazyBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+        calls = []
+        render_variation = StdImageFieldFile.render_variation
+
+        def _render_variation(*args, **kwargs):
+            calls.append(kwargs)
+            return render_variation(*args, **kwargs)
+
+        monkeypatch.setattr(
+            StdImageFieldFile, "render_variation", staticmethod(_render_variation)
+        )
+        response = Client().get(obj.image.thumbnail.url)
+        response.close()
+        assert response.status_code == 200
+        field = LazyBackendModel._meta.get_field("image")
+        assert calls[0].items() >= field.get_render_kwargs().items()
+
+    def test_render__lock(self, db, monkeypatch):
+        obj = LazyBackendModel.objects.create(image=self.fixtures["600x400.jpg"])
+        url = obj.image.thumbnail.url
+        calls = []
+        render_variation = StdImageFieldFile.render_variation
+
+        def _render_variation(*args, **kwargs):
+            calls.append(args)
+            time.sleep(0.2)
+            return render_variation(*args, **kwargs)
+
+        monkeypatch.setattr(
+            StdImageFieldFile, "render_variation", staticmethod(_render_variation)
+        )
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(Client().get(url)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        for response in responses:
+            response.close()
+        assert [response.status_code for response in responses] == [200] * 5
@@ -0,0 +1,184 @@
+import pickle
+
+import pytest
+from django.core.cache import caches
+from django.core.management import call_command
+from PIL import Image
+
+from stdimage.cache import RenderCache
+from stdimage.models import StdImageFieldFile
+from stdimage.utils import prefetch_variation_urls
+from tests.models import RenderCacheModel, SrcsetURLCacheModel, URLCacheModel
+from tests.storage import CountingFileSystemStorage
+from tests.test_models import TestStdImage
+
+
+class TestRenderCache:
+    def test_get_key(self):
+        variation = {"name": "thumbnail", "width": 100, "height": 100, "crop": False}
+        key = RenderCache.get_key("abc", variation, StdImageFieldFile)
+        assert key.startswith("abc:")
+        assert key == RenderCache.get_key(
+            "abc", dict(variation, name="other"), StdImageFieldFile
+        )
+        assert key != RenderCache.get_key(
+            "abc", dict(variation, crop=True), StdImageFieldFile
+        )
+        assert key != RenderCache.get_key("def", variation, StdImageFieldFile)
+
+    def test_get_set(self):
+        cache = RenderCache()
+        assert cache.get("a") is None
+        cache.set("a", b"123")
+        cache.set("a", b"1234")
+        assert cache.get("a") == b"1234"
+        assert (cache.hits, cache.misses, cache.size, len(cache)) == (1, 1, 4, 1)
+        cache.clear()
+        assert (cache.hits, cache.misses, cache.size, len(cache)) == (0, 0, 0, 0)
+
+    def test_lru_eviction(self):
+        cache = RenderCache(max_size=10)
+        cache.set("a", b"1234")
+        cache.set("b", b"1234")
+        cache.get("a")
+        cache.set("c", b"1234")
+        assert cache.get("b") is None
+        assert cache.get("a") == b"1234"
+        assert cache.get("c") == b"1234"
+        assert cache.size == 8
+
+    def test_too_large(self):
+        cache = RenderCache(max_size=2)
+        cache.set("a", b"123")
+        assert len(cache) == 0
+
+    def test_pickle(self):
+        cache = RenderCache(max_size=10)
+        cache.set("a", b"123")
+        cache = pickle.loads(pickle.dumps(cache))
+        assert (cache.max_size, cache.size, len(cache)) == (10, 0, 0)
+        cache.set("a", b"123")
+        assert cache.get("a") == b"123"
+
+
+class TestRenderCacheModel(TestStdImage):
+    @pytest.fixture(autouse=True)
+    def render_cache(self):
+        cache = RenderCacheModel._meta.get_field("image").render_cache
+        cache.clear()
+        yield cache
+
+    def test_render(self, db, monkeypatch, render_cache):
+        first = RenderCacheModel.objects.create(image=self.fixtures["600x400.jpg"])
+        assert (render_cache.hits, render_cache.misses) == (0, 2)
+
+        def _open(*args, **kwargs):
+            raise AssertionError("Image must not be decoded.")
+
+        monkeypatch.setattr(Image, "open", _open)
+        self.fixtures["600x400.jpg"].seek(0)
+        second = RenderCacheModel.objects.create(image=self.fixtures["600x400.jpg"])
+        assert (render_cache.hits, render_cache.misses) == (2, 2)
+        assert second.image.thumbnail.name != first.image.thumbnail.name
+        with first.image.medium.open() as a, second.image.medium.open() as b:
+            assert a.read() == b.read()
+
+    def test_render__partial(self, db, render_cache):
+        obj = RenderCacheModel.objects.create(image=self.fixtures["600x400.jpg"])
+        render_cache.clear()
+        obj.image.batch_render_variations(
+            obj.image.name,
+            [obj.image.field.variations["medium"]],
+            storage=obj.image.storage,
+            cache=render_cache,
+        )
+        obj.image.render_variations()
+        assert (render_cache.hits, render_cache.misses) == (1, 2)
+        assert len(render_cache) == 2
+
+    def test_rendervariations(self, db, render_cache):
+        for _ in range(2):
+            self.fixtures["600x400.jpg"].seek(0)
+            RenderCacheModel.objects.create(image=self.fixtures["600x400.jpg"])
+        render_cache.clear()
+        call_command("rendervariations", "tests.RenderCacheModel.image", replace=True)
+        assert (render_cache.hits, render_cache.misses) == (2, 2)
+
+
+class TestURLCache(TestStdImage):
+    @pytest.fixture(autouse=True)
+    def _clear_cache(self):
+        caches["default"].clear()
+        CountingFileSystemStorage.reset()
+
+    def test_url(self, db):
+        obj = URLCacheModel.objects.create(image=self.fixtures["600x400.jpg"])
+        assert obj.image.url == "/img/600x400.jpg"
+        assert obj.image.thumbnail.url == "/img/600x400.thumbnail.jpg"
+        obj = URLCacheModel.objects.get()
+        assert obj.image.url == "/img/600x400.jpg"
+        assert obj.image.thumbnail.url == "/img/600x400.thumbnail.jpg"
+        assert CountingFileSystemStorage.calls["url"] == 2
+
+    def test_prefetch_variation_urls(self, db, monkeypatch):
+        for _ in range(3):
+            URLCacheModel.objects.create(image=self.fixtures["600x400.jpg"])
+        cache = caches["default"]
+        get_many = cache.get_many
+        lookups = []
+
+        def _get_many(keys, *args, **kwargs):
+            lookups.append(len(keys))
+            return get_many(keys, *args, **kwargs)
+
+        monkeypatch.setattr(cache, "get_many", _get_many)
+        objs = prefetch_variation_urls(
+            URLCacheModel.objects.all(), "image", ["thumbnail"]
+        )
+        assert lookups == [3]
+        assert CountingFileSystemStorage.calls["url"] == 3
+        assert [obj.image.thumbnail.url for obj in objs] == [
+            obj.image.thumbnail.name.replace("img/", "/img/") for obj in objs
+        ]
+
+        CountingFileSystemStorage.reset()
+        lookups.clear()
+        objs = prefetch_variation_urls(URLCacheModel.objects.all(), "image")
+        assert lookups == [6]
+        # thumbnail URLs are cached already
+        assert CountingFileSystemStorage.calls["url"] == 3
+        for obj in objs:
+            obj.image.thumbnail.url
+            obj.image.medium.url
+        assert lookups == [6]
+        assert CountingFileSystemStorage.calls["url"] == 3
+
+    def test_srcset(self, db, monkeypatch):
+        SrcsetURLCacheModel.objects.create(image=self.fixtures["600x400.jpg"])
+        obj = SrcsetURLCacheModel.objects.get()
+        cache = caches["default"]
+        get_many = cache.get_many
+        lookups = []
+
+        def _get_many(keys, *args, **kwargs):
+            lookups.append(len(keys))
+            return get_many(keys, *args, **kwargs)
+
+        def _open(*args, **kwargs):
+            raise AssertionError("The image must not be read.")
+
+        monkeypatch.setattr(cache, "get_many", _get_many)
+        monkeypatch.setattr(obj.image.storage, "open", _open)
+        expected = (
+            "/img/600x400.w100.jpg 100w, /img/600x400.w200.jpg 200w,"
+            " /img/600x400.jpg 600w"
+        )
+        assert obj.image.srcset == expected
+        assert lookups == [3]
+        assert CountingFileSystemStorage.calls["url"] == 3
+        assert obj.image.srcset == expected
+        assert lookups == [3, 3]
+        assert CountingFileSystemStorage.calls["url"] == 3
+
+    def test_prefetch_variation_urls__empty(self, db):
+        assert prefetch_variation_urls(URLCacheModel.objects.none(), "image") == []
@@ -1,12 +1,24 @@
 import hashlib
 import os
+import shutil
 import time
 from concurrent.futures import ThreadPoolExecutor
 
 import pytest
+from django.conf import settings
 from django.core.management import CommandError, call_command
 
-from tests.models import CustomRenderVariationsModel, MyStorageModel, ThumbnailModel
+from stdimage.fingerprints import FingerprintManifest, get_fingerprints
+from stdimage.management.commands import rendervariations
+from stdimage.management.commands.rendervariations import Command
+from stdimage.management.commands.stdimage_cleanup import FileNameSet
+from tests.models import (
+    CountingStorageModel,
+    CustomRenderVariationsModel,
+    MyStorageModel,
+    ThumbnailModel,
+)
+from tests.storage import CountingFileSystemStorage
 
 
 @pytest.mark.django_db
@@ -37,6 +49,71 @@ class TestRenderVariations:
         call_command("rendervariations", "tests.ThumbnailModel.image")
         assert any([os.path.exists(f) for f in file_names])
 
+    @pytest.mark.parametrize("executor", ["process", "thread"])
+    def test_workers(self, image_upload_file, executor):
+        objs = [
+            ThumbnailModel.objects.create(image=image_upload_file) for _ in range(25)
+        ]
+        file_names = [obj.image.thumbnail.path for obj in objs]
+        for obj in objs:
+            obj.image.delete_variations()
+        assert not any([os.path.exists(f) for f in file_names])
+        call_command(
+            "rendervariations",
+            "tests.ThumbnailModel.image",
+            workers=4,
+            executor=executor,
+            chunk_size=3,
+        )
+        assert all([os.path.exists(f) for f in file_names])
+
+    def test_workers__invalid(self):
+        with pytest.raises(CommandError):
+            call_command("rendervariations", "tests.ThumbnailModel.image", workers=0)
+
+    def test_workers__ignore_missing(self, image_upload_file):
+        objs = [
+            ThumbnailModel.objects.create(image=image_upload_file) for _ in range(5)
+        ]
+        os.remove(objs[0].image.path)
+        call_command(
+            "rendervariations",
+            "tests.ThumbnailModel.image",
+            "--ignore-missing",
+            "--workers=2",
+            replace=True,
+        )
+        assert os.path.exists(objs[-1].image.thumbnail.path)
+
+    def test_workers__no_ignore_missing(self, image_upload_file):
+        obj = ThumbnailModel.objects.create(image=image_upload_file)
+        os.remove(obj.image.path)
+        with pytest.raises(CommandError):
+            call_command(
+                "rendervariations",
+                "tests.ThumbnailModel.image",
+                "--workers=2",
+                replace=True,
+            )
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_stats(self, image_upload_file, capsys, workers):
+        for _ in range(3):
+            CountingStorageModel.objects.create(image=image_upload_file)
+        call_command(
+            "rendervariations",
+            "tests.CountingStorageModel.image",
+            "--stats",
+            workers=workers,
+            executor="thread",
+            replace=True,
+        )
+        lines = capsys.readouterr().out.splitlines()[-4:]
+        assert lines[0].split()[:3] == ["variation", "count", "cached"]
+        assert lines[1].split()[:3] == ["medium", "3", "0"]
+        assert lines[2].split()[:3] == ["thumbnail", "3", "0"]
+        assert lines[3].split()[:2] == ["(source)", "3"]
+
     def test_no_replace(self, image_upload_file):
         obj = ThumbnailModel.objects.create(image=image_upload_file)
         file_path = obj.image.thumbnail.path
@@ -51,6 +128,199 @@ class TestRenderVariations:
         after = os.path.getmtime(file_path)
         assert before == after
 
+    def test_no_replace__storage_index(self, image_upload_file):
+        objs = [
+            CountingStorageModel.objects.create(image=image_upload_file)
+            for _ in range(10)
+        ]
+        objs[0].image.delete_variations()
+        CountingFileSystemStorage.reset()
+        call_command("rendervariations", "tests.CountingStorageModel.image")
+        assert os.path.exists(objs[0].image.thumbnail.path)
+        # one listing instead of one request per variation and file
+        assert CountingFileSystemStorage.calls["listdir"] == 1
+        # existence checks are only made by storage.save and
+        # once to remove the checkpoint of the completed run
+        assert CountingFileSystemStorage.calls["exists"] == 3
+
+    def test_replace__storage_index(self, image_upload_file):
+        CountingStorageModel.objects.create(image=image_upload_file)
+        manifest = FingerprintManifest(CountingStorageModel._meta.get_field("image"))
+        manifest.storage.delete(manifest.name)
+        CountingFileSystemStorage.reset()
+        call_command(
+            "rendervariations", "tests.CountingStorageModel.image", replace=True
+        )
+        assert CountingFileSystemStorage.calls["listdir"] == 1
+        assert CountingFileSystemStorage.calls["delete"] == 2
+
+    def test_changed_only(self, image_upload_file, monkeypatch):
+        obj = CountingStorageModel.objects.create(image=image_upload_file)
+        field = CountingStorageModel._meta.get_field("image")
+        manifest = FingerprintManifest(field)
+        manifest.storage.delete(manifest.name)
+        medium = obj.image.medium.path
+        thumbnail = obj.image.thumbnail.path
+        # without fingerprints, all variations are considered changed
+        assert manifest.get_changed(field) == {"medium", "thumbnail"}
+        call_command(
+            "rendervariations", "tests.CountingStorageModel.image", changed_only=True
+        )
+        assert manifest.load() == get_fingerprints(field)
+        assert not manifest.get_changed(field)
+
+        monkeypatch.setitem(
+            field.variations, "thumbnail", dict(field.variations["thumbnail"], width=50)
+        )
+        os.remove(medium)
+        before = os.path.getmtime(thumbnail)
+        time.sleep(0.1)
+        CountingFileSystemStorage.reset()
+        call_command(
+            "rendervariations", "tests.CountingStorageModel.image", changed_only=True
+        )
+        # the changed variation is replaced and the missing one rendered
+        assert CountingFileSystemStorage.calls["delete"] == 2
+        assert os.path.getmtime(thumbnail) != before
+        assert obj.image.thumbnail.width == 50
+        assert os.path.exists(medium)
+        assert not manifest.get_changed(field)
+
+        before = os.path.getmtime(thumbnail)
+        CountingFileSystemStorage.reset()
+        call_command(
+            "rendervariations", "tests.CountingStorageModel.image", changed_only=True
+        )
+        assert os.path.getmtime(thumbnail) == before
+        assert CountingFileSystemStorage.calls["delete"] == 1
+
+    def test_changed_only__shard(self, image_upload_file, monkeypatch):
+        objs = [
+            CountingStorageModel.objects.create(image=image_upload_file)
+            for _ in range(3)
+        ]
+        field = CountingStorageModel._meta.get_field("image")
+        manifest = FingerprintManifest(field)
+        manifest.save(get_fingerprints(field))
+        monkeypatch.setitem(
+            field.variations, "thumbnail", dict(field.variations["thumbnail"], width=50)
+        )
+        for shard in ["1/2", "2/2"]:
+            call_command(
+                "rendervariations",
+                "tests.CountingStorageModel.image",
+                changed_only=True,
+                shard=shard,
+            )
+            # a shard doesn't mark the other rows as up to date
+            assert manifest.get_changed(field) == {"thumbnail"}
+        for obj in objs:
+            obj.refresh_from_db()
+            assert obj.image.thumbnail.width == 50
+
+        CountingFileSystemStorage.reset()
+        call_command(
+            "rendervariations",
+            "tests.CountingStorageModel.image",
+            store_fingerprints=True,
+        )
+        assert not manifest.get_changed(field)
+        # no upload directory is listed, nothing is rendered
+        assert "listdir" not in CountingFileSystemStorage.calls
+
+    @pytest.mark.parametrize(
+        "options", [{"changed_only": True}, {"replace": True}, {"shard": "1/2"}]
+    )
+    def test_store_fingerprints__render_options(self, options):
+        with pytest.raises(CommandError):
+            call_command(
+                "rendervariations",
+                "tests.CountingStorageModel.image",
+                store_fingerprints=True,
+                **options,
+            )
+
+    def test_changed_only__replace(self):
+        with pytest.raises(CommandError):
+            call_command(
+                "rendervariations",
+                "tests.ThumbnailModel.image",
+                replace=True,
+                changed_only=True,
+            )
+
+    def test_iter_rows(self, image_upload_file):
+        objs = [
+            ThumbnailModel.objects.create(image=image_upload_file) for _ in range(5)
+        ]
+        rows = Command.iter_rows(ThumbnailModel.objects.all(), "image", 2)
+        assert list(rows) == [(obj.pk, obj.image.name) for obj in objs]
+
+    def test_resume(self, image_upload_file, monkeypatch):
+        objs = [
+            ThumbnailModel.objects.create(image=image_upload_file) for _ in range(5)
+        ]
+        field = ThumbnailModel._meta.get_field("image")
+        rendered = []
+
+        def _render_field_variations(kwargs):
+            if len(rendered) == 3:
+                raise KeyboardInterrupt
+            rendered.append(kwargs["file_name"])
+            return kwargs["file_name"]
+
+        monkeypatch.setattr(
+            rendervariations, "render_field_variations", _render_field_variations
+        )
+        with pytest.raises(KeyboardInterrupt):
+            call_command("rendervariations", "tests.ThumbnailModel.image", batch_size=2)
+        checkpoint = rendervariations.Checkpoint(field)
+        assert checkpoint.load() == objs[1].pk
+
+        rendered.clear()
+        call_command(
+            "rendervariations", "tests.ThumbnailModel.image", batch_size=2, resume=True
+        )
+        assert rendered == [obj.image.name for obj in objs[2:]]
+        # the checkpoint of a completed run is removed
+        assert checkpoint.load() is None
+
+    def test_pk_range_and_shard(self, image_upload_file, monkeypatch):
+        objs = [
+            ThumbnailModel.objects.create(image=image_upload_file) for _ in range(6)
+        ]
+        rendered = []
+
+        def _render_field_variations(kwargs):
+            rendered.append(kwargs["file_name"])
+            return kwargs["file_name"]
+
+        monkeypatch.setattr(
+            rendervariations, "render_field_variations", _render_field_variations
+        )
+        call_command(
+            "rendervariations",
+            "tests.ThumbnailModel.image",
+            pk_range="%d:%d" % (objs[1].pk, objs[5].pk),
+        )
+        assert rendered == [obj.image.name for obj in objs[1:5]]
+
+        shards = []
+        for shard in ["1/2", "2/2"]:
+            rendered.clear()
+            call_command("rendervariations", "tests.ThumbnailModel.image", shard=shard)
+            shards.append(set(rendered))
+        assert not shards[0] & shards[1]
+        assert shards[0] | shards[1] == {obj.image.name for obj in objs}
+
+    @pytest.mark.parametrize(
+        "options",
+        [{"pk_range": "a:b"}, {"shard": "0/2"}, {"shard": "3/2"}, {"shard": "x"}],
+    )
+    def test_pk_range_and_shard__invalid(self, options):
+        with pytest.raises(CommandError):
+            call_command("rendervariations", "tests.ThumbnailModel.image", **options)
+
     def test_replace(self, image_upload_file):
         obj = ThumbnailModel.objects.create(image=image_upload_file)
         file_path = obj.image.thumbnail.path
@@ -136,3 +406,59 @@ class TestRenderVariations:
         with open(file_path, "rb") as f:
             after = hashlib.md5(f.read()).hexdigest()
         assert before == after
+
+
+@pytest.mark.django_db
+class TestCleanup:
+    @pytest.fixture(autouse=True)
+    def _clean_media_root(self):
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, "img"), ignore_errors=True)
+
+    @pytest.fixture
+    def orphans(self, image_upload_file):
+        obj = ThumbnailModel.objects.create(image=image_upload_file)
+        old = ThumbnailModel.objects.create(image=image_upload_file)
+        paths = [old.image.path, old.image.thumbnail.path]
+        # reassigned in code, the old files are orphaned
+        old.image = obj.image.name
+        old.save()
+        return obj, paths
+
+    def test_dry_run(self, orphans, capsys):
+        obj, paths = orphans
+        call_command(
+            "stdimage_cleanup", "tests.ThumbnailModel.image", dry_run=True, min_age=0
+        )
+        lines = capsys.readouterr().out.splitlines()
+        assert sorted(lines[:-1]) == sorted(
+            os.path.relpath(path, settings.MEDIA_ROOT) for path in paths
+        )
+        assert lines[-1] == "Found 2 unreferenced files."
+        assert all(os.path.exists(path) for path in paths)
+
+    def test_delete(self, orphans, capsys):
+        obj, paths = orphans
+        call_command("stdimage_cleanup", "tests.ThumbnailModel.image", min_age=0)
+        assert capsys.readouterr().out == "Deleted 2 unreferenced files.\n"
+        assert not any(os.path.exists(path) for path in paths)
+        assert os.path.exists(obj.image.path)
+        assert os.path.exists(obj.image.thumbnail.path)
+
+    def test_min_age(self, orphans, capsys):
+        obj, paths = orphans
+        call_command("stdimage_cleanup", "tests.ThumbnailModel.image")
+        assert capsys.readouterr().out == "Deleted 0 unreferenced files.\n"
+        assert all(os.path.exists(path) for path in paths)
+
+    def test_callable_upload_to(self):
+        with pytest.raises(CommandError):
+            call_command(
+                "stdimage_cleanup", "tests.ThumbnailWithoutDirectoryModel.image"
+            )
+
+    def test_file_name_set(self):
+        names = FileNameSet(("img/%d.jpg" % (i % 50) for i in range(100)), 7)
+        assert len(names) == 50
+        assert "img/0.jpg" in names
+        assert "img/49.jpg" in names
+        assert "img/50.jpg" not in names
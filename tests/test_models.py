@@ -1,12 +1,21 @@
 import io
 import os
+import pickle
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
+from asgiref.sync import async_to_sync
 from django.conf import settings
-from django.core.files.storage import default_storage
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from PIL import Image
+from PIL import Image, ImageChops, ImageFile, ImageStat
+
+from stdimage.fingerprints import get_fingerprint
+from stdimage.models import JPEGField, StdImageField, StdImageFieldFile, VariationSpec
 
 from . import models
 from .models import (
@@ -100,6 +109,313 @@ class TestModel(TestStdImage):
             source_file.seek(0)
             assert source_file.read() != f.read()
 
+    def test_render_variations__single_decode(self, db, monkeypatch):
+        instance = ResizeModel.objects.create(image=self.fixtures["600x400.jpg"])
+        storage = instance.image.storage
+        opened = []
+        storage_open = storage.open
+
+        def _open(name, *args, **kwargs):
+            opened.append(name)
+            return storage_open(name, *args, **kwargs)
+
+        monkeypatch.setattr(storage, "open", _open)
+        instance.image.render_variations()
+        assert opened == ["img/600x400.jpg"]
+
+    def test_render_variations__reductions(self, db, monkeypatch):
+        instance = models.ReducingGapModel.objects.create(
+            image=self.fixtures["600x400.jpg"]
+        )
+        sizes = []
+        process_variation = StdImageFieldFile.process_variation
+
+        def _process_variation(variation, image, base=None, **kwargs):
+            sizes.append((variation["name"], base.size))
+            return process_variation(variation, image, base=base, **kwargs)
+
+        monkeypatch.setattr(
+            StdImageFieldFile, "process_variation", staticmethod(_process_variation)
+        )
+        instance.image.render_variations()
+        # each variation is resized from a power of two reduction of the source
+        assert sizes == [("thumbnail", (300, 200)), ("square", (150, 100))]
+        assert instance.image.square.width == 50
+
+    def test_render_variations__independent(self, tmp_path):
+        storage = FileSystemStorage(location=str(tmp_path))
+        stripes = Image.new("L", (1200, 800), 0)
+        stripes.putdata([255 * (i % 2) for i in range(1200)] * 800)
+        with io.BytesIO() as f:
+            stripes.save(f, format="PNG")
+            name = storage.save("stripes.png", ContentFile(f.getvalue()))
+        thumb = {"width": 100, "height": 100}
+        others = {
+            "large": {"width": 600, "height": 600},
+            "pixel": {"width": 600, "height": 600, "resample": Image.NEAREST},
+            "exact": {"width": 300, "height": 300, "reducing_gap": None},
+        }
+
+        def render(**variations):
+            field = StdImageField(variations=variations)
+            field.attr_class.batch_render_variations(
+                name, list(field.variations.values()), True, storage
+            )
+            with open(storage.path("stripes.thumb.png"), "rb") as f:
+                return f.read()
+
+        expected = render(thumb=thumb)
+        assert render(thumb=thumb, **others) == expected
+        with Image.open(storage.path("stripes.thumb.png")) as img:
+            assert ImageStat.Stat(img).mean[0] == pytest.approx(128, abs=2)
+
+    def test_render_variations__save_options(self, tmp_path, make_image):
+        storage = FileSystemStorage(location=str(tmp_path))
+        name = storage.save("photo.jpg", ContentFile(make_image((1200, 800))))
+
+        def render(**variations):
+            field = StdImageField(variations=variations)
+            field.attr_class.batch_render_variations(
+                name, list(field.variations.values()), True, storage
+            )
+            with open(storage.path("photo.b.jpg"), "rb") as f:
+                return f.read()
+
+        expected = render(b=(400, 400))
+        # b reuses the resized image of a, that is as small as b
+        assert render(a=(400, 400), b=(400, 400)) == expected
+        with Image.open(storage.path("photo.b.jpg")) as img:
+            assert img.info.get("progressive")
+
+    @pytest.mark.parametrize("spool_max_size", [100, 1024 * 1024])
+    def test_render_variations__spool(self, db, monkeypatch, spool_max_size):
+        monkeypatch.setattr(StdImageFieldFile, "spool_max_size", spool_max_size)
+        instance = ResizeModel.objects.create(image=self.fixtures["600x400.jpg"])
+        assert instance.image.medium.width == 400
+        assert instance.image.medium.size == os.path.getsize(instance.image.medium.path)
+
+    def test_reducing_gap(self, db, monkeypatch):
+        sizes = []
+        process_variation = StdImageFieldFile.process_variation
+
+        def _process_variation(variation, image, **kwargs):
+            sizes.append(image.size)
+            return process_variation(variation, image, **kwargs)
+
+        monkeypatch.setattr(
+            StdImageFieldFile, "process_variation", staticmethod(_process_variation)
+        )
+        with io.BytesIO() as f:
+            Image.new("RGB", (600, 400), (255, 55, 255)).save(f, format="JPEG")
+            image = SimpleUploadedFile("600x400.jpg", f.getvalue())
+        instance = models.ReducingGapModel.objects.create(image=image)
+        # JPEG is decoded in draft mode at half of its size
+        assert sizes[0] == (300, 200)
+        assert instance.image.thumbnail.width == 100
+        assert instance.image.thumbnail.height <= 75
+        assert instance.image.square.width == 50
+        assert instance.image.square.height == 50
+
+    @pytest.mark.parametrize(
+        "model, reducing_gap",
+        [(models.ReducingGapModel, 2.0), (models.ExactModel, None)],
+    )
+    def test_reducing_gap__resize(self, db, monkeypatch, model, reducing_gap):
+        reducing_gaps = []
+        resize = Image.Image.resize
+
+        def _resize(image, size, *args, **kwargs):
+            reducing_gaps.append(kwargs.get("reducing_gap"))
+            return resize(image, size, *args, **kwargs)
+
+        monkeypatch.setattr(Image.Image, "resize", _resize)
+        model.objects.create(image=self.fixtures["600x400.gif"])
+        # exact variations aren't reduced by Pillow's default reducing_gap
+        assert reducing_gaps
+        assert set(reducing_gaps) == {reducing_gap}
+
+    @pytest.mark.parametrize("fixture", ["600x400.gif", "600x400.jpg"])
+    def test_reducing_gap__no_draft(self, db, fixture):
+        instance = models.ReducingGapModel.objects.create(image=self.fixtures[fixture])
+        assert instance.image.thumbnail.width == 100
+        assert instance.image.square.width == 50
+
+    def test_formats(self, db):
+        instance = models.FormatsModel.objects.create(
+            image=self.fixtures["600x400.gif"]
+        )
+        assert set(instance._meta.get_field("image").variations) == {
+            "thumbnail",
+            "square",
+            "lossless",
+            "thumbnail_webp",
+            "square_webp",
+            "lossless_webp",
+        }
+        assert instance.image.thumbnail.name == "img/600x400.thumbnail.gif"
+        assert instance.image.lossless.name == "img/600x400.lossless.png"
+        assert instance.image.thumbnail_webp.name == "img/600x400.thumbnail_webp.webp"
+        for name, file_format in [
+            ("thumbnail", "GIF"),
+            ("lossless", "PNG"),
+            ("thumbnail_webp", "WEBP"),
+            ("square_webp", "WEBP"),
+        ]:
+            with Image.open(getattr(instance.image, name).path) as img:
+                assert img.format == file_format
+        assert instance.image.square_webp.width == 50
+        assert instance.image.square_webp.height == 50
+
+    def test_formats__single_resize(self, db, monkeypatch):
+        instance = models.FormatsModel.objects.create(
+            image=self.fixtures["600x400.jpg"]
+        )
+        resized = []
+        image_resize = Image.Image.resize
+
+        def _resize(image, size, *args, **kwargs):
+            resized.append(tuple(size))
+            return image_resize(image, size, *args, **kwargs)
+
+        monkeypatch.setattr(Image.Image, "resize", _resize)
+        instance.image.render_variations()
+        assert resized.count((50, 50)) == 1
+        assert instance.image.square_webp.width == 50
+
+    def test_formats__delete(self, db):
+        instance = models.FormatsModel.objects.create(
+            image=self.fixtures["600x400.jpg"]
+        )
+        path = instance.image.thumbnail_webp.path
+        assert os.path.exists(path)
+        instance.image.delete()
+        assert not os.path.exists(path)
+
+    def test_srcset(self, db):
+        instance = models.SrcsetModel.objects.create(image=self.fixtures["600x400.jpg"])
+        field = instance._meta.get_field("image")
+        assert field.srcset == (100, 200, 400, 800)
+        assert field.variations["w200"]["width"] == 200
+        assert field.variations["w200"]["height"] is None
+        assert instance.image.w200.width == 200
+        assert instance.image.w200.height == 133
+        assert instance.image.w400_webp.width == 400
+        # wider than the source
+        assert not os.path.exists(instance.image.w800.path)
+        assert not os.path.exists(instance.image.w800_webp.path)
+        assert instance.image.srcset == (
+            "/img/600x400.w100.jpg 100w, /img/600x400.w200.jpg 200w,"
+            " /img/600x400.w400.jpg 400w, /img/600x400.jpg 600w"
+        )
+        assert instance.image.get_srcset("WEBP") == (
+            "/img/600x400.w100_webp.webp 100w, /img/600x400.w200_webp.webp 200w,"
+            " /img/600x400.w400_webp.webp 400w"
+        )
+
+    def test_srcset__single_pass(self, db, monkeypatch):
+        instance = models.SrcsetModel.objects.create(image=self.fixtures["600x400.jpg"])
+        sizes = []
+        resize = Image.Image.resize
+
+        def _resize(image, size, *args, **kwargs):
+            sizes.append(tuple(size))
+            return resize(image, size, *args, **kwargs)
+
+        monkeypatch.setattr(Image.Image, "resize", _resize)
+        instance.image.render_variations()
+        # each width is resized once, WebP siblings reuse it
+        assert sorted(sizes) == [(100, 67), (200, 133), (400, 267)]
+
+    def test_srcset__no_file_read(self, db, monkeypatch):
+        models.SrcsetModel.objects.create(image=self.fixtures["600x400.jpg"])
+        instance = models.SrcsetModel.objects.get()
+        monkeypatch.setattr(
+            StdImageFieldFile, "open", lambda *args, **kwargs: pytest.fail()
+        )
+        assert instance.image.srcset.endswith("/img/600x400.jpg 600w")
+
+    def test_metadata(self, db, monkeypatch):
+        instance = models.MetadataModel.objects.create(
+            image=self.fixtures["600x400.jpg"]
+        )
+        size = os.path.getsize(instance.image.thumbnail.path)
+        instance = models.MetadataModel.objects.get()
+        assert instance.image_metadata["thumbnail"] == {
+            "name": "img/600x400.thumbnail.jpg",
+            "width": 100,
+            "height": 67,
+            "size": size,
+            # the last fixture of that name is a PNG
+            "format": "PNG",
+        }
+        assert instance.image_metadata["square"]["width"] == 50
+
+        def _open(*args, **kwargs):
+            pytest.fail("The variation file must not be opened.")
+
+        monkeypatch.setattr(default_storage, "open", _open)
+        monkeypatch.setattr(default_storage, "size", _open)
+        assert instance.image.thumbnail.width == 100
+        assert instance.image.thumbnail.height == 67
+        assert instance.image.thumbnail.size == size
+        assert instance.image.square.height == 50
+
+    def test_metadata__outdated(self, db):
+        instance = models.MetadataModel.objects.create(
+            image=self.fixtures["600x400.jpg"]
+        )
+        instance.image.name = "img/600x400_other.jpg"
+        assert instance.image.thumbnail.metadata is None
+        instance = models.MetadataModel.objects.create(
+            image=self.fixtures["600x400.gif"]
+        )
+        instance.image_metadata["square"]["name"] = "img/other.square.gif"
+        instance.image.render_variations(replace={"thumbnail"})
+        # outdated metadata is dropped, up-to-date metadata is kept
+        assert set(instance.image_metadata) == {"_source", "thumbnail"}
+
+    def test_metadata__save(self, db):
+        instance = models.MetadataModel.objects.create()
+        instance.image.save("new.gif", self.fixtures["100.gif"])
+        instance = models.MetadataModel.objects.get()
+        assert instance.image_metadata["thumbnail"]["name"] == "img/new.thumbnail.gif"
+
+    def test_metadata__single_save(self, db, monkeypatch):
+        instance = models.MetadataModel.objects.create()
+        saves = []
+        model_save = models.MetadataModel.save
+
+        def _save(self, *args, **kwargs):
+            saves.append(self.image_metadata)
+            return model_save(self, *args, **kwargs)
+
+        monkeypatch.setattr(models.MetadataModel, "save", _save)
+        instance.image.save("new.gif", self.fixtures["100.gif"])
+        assert len(saves) == 1
+        assert saves[0]["thumbnail"]["name"] == "img/new.thumbnail.gif"
+
+    def test_variations__lazy(self, db):
+        ResizeModel.objects.create(image=self.fixtures["600x400.jpg"])
+        instance = ResizeModel.objects.get()
+        # no field file is created on model initialization
+        assert isinstance(instance.__dict__["image"], str)
+        assert instance.image.thumbnail is instance.image.thumbnail
+        assert instance.image.thumbnail.name == "img/600x400.thumbnail.jpg"
+        instance.image.name = "img/other.jpg"
+        assert instance.image.thumbnail.name == "img/other.thumbnail.jpg"
+
+    def test_variations__missing(self, db):
+        instance = ResizeModel()
+        assert not hasattr(instance.image, "thumbnail")
+        instance = ResizeModel.objects.create(image=self.fixtures["600x400.jpg"])
+        assert not hasattr(instance.image, "small")
+
+    def test_set_variations(self, db):
+        ResizeModel.objects.create(image=self.fixtures["600x400.jpg"])
+        instance = ResizeModel.objects.get()
+        ResizeModel._meta.get_field("image").set_variations(instance)
+        assert len(instance.image._variation_files) == 2
+
     def test_cropping(self, db):
         instance = ResizeCropModel.objects.create(image=self.fixtures["600x400.jpg"])
         assert instance.image.thumbnail.width == 150
@@ -126,6 +442,17 @@ class TestModel(TestStdImage):
         path = os.path.join(IMG_DIR, "image.thumbnail.gif")
         assert not os.path.exists(path)
 
+    def test_delete_variations__serial(self, db, monkeypatch):
+        instance = models.FormatsModel.objects.create(
+            image=self.fixtures["600x400.gif"]
+        )
+        paths = [instance.image.thumbnail.path, instance.image.thumbnail_webp.path]
+        monkeypatch.setattr(
+            "stdimage.storage.ThreadPoolExecutor", lambda *args: pytest.fail()
+        )
+        instance.image.delete_variations()
+        assert not any(os.path.exists(path) for path in paths)
+
     def test_fore_min_size(self, admin_client):
         admin_client.post(
             "/admin/tests/forceminsizemodel/add/",
@@ -171,6 +498,369 @@ class TestModel(TestStdImage):
         assert instance.image.thumbnail == deferred.image.thumbnail
 
 
+class TestVariationSpec:
+    def test_add_variation(self):
+        field = StdImageField(
+            variations={
+                "thumbnail": (100, 75, True, {"quality": 90}),
+                "large": {"width": 800, "height": 600, "custom": [1, 2]},
+            }
+        )
+        spec = field.variations["thumbnail"]
+        assert isinstance(spec, VariationSpec)
+        assert spec["width"] == 100
+        assert spec["crop"] is True
+        assert spec["kwargs"] == {"quality": 90}
+        assert spec.get("missing") is None
+        assert field.variations["large"]["custom"] == (1, 2)
+        assert dict(spec) == {
+            **StdImageField.def_variation,
+            "width": 100,
+            "height": 75,
+            "crop": True,
+            "kwargs": {"quality": 90},
+            "name": "thumbnail",
+        }
+
+    def test_immutable(self):
+        spec = VariationSpec({"width": 100, "kwargs": {"quality": 90}})
+        with pytest.raises(TypeError):
+            spec["width"] = 200
+        with pytest.raises(TypeError):
+            spec["kwargs"]["quality"] = 50
+        with pytest.raises(AttributeError):
+            spec._values = ()
+        with pytest.raises(AttributeError):
+            spec.width = 200
+
+    def test_hash_and_pickle(self):
+        spec = VariationSpec({"width": 100, "kwargs": {"quality": 90}})
+        same = VariationSpec({"width": 100, "kwargs": {"quality": 90}})
+        assert spec == same
+        assert hash(spec) == hash(same)
+        assert spec != VariationSpec({"width": 200, "kwargs": {"quality": 90}})
+        assert spec == {"width": 100, "kwargs": {"quality": 90}}
+        assert pickle.loads(pickle.dumps(spec)) == spec
+        assert len({spec, same}) == 1
+
+    def test_fingerprint(self):
+        variation = {"width": 100, "kwargs": {"quality": 90}}
+        assert get_fingerprint(
+            VariationSpec(variation), StdImageFieldFile
+        ) == get_fingerprint(variation, StdImageFieldFile)
+
+
+class TestThreadSafety:
+    fields = [
+        StdImageField(
+            variations={
+                "full": (None, None),
+                "wide": {"width": 120, "height": None},
+                "thumbnail": (100, 75),
+                "square": (50, 50, True),
+            },
+            formats=("WEBP",),
+        ),
+        JPEGField(variations={"full": (None, None), "thumbnail": (100, 75, True)}),
+    ]
+
+    def render(self, location, sources):
+        storage = FileSystemStorage(location=location)
+        names = []
+        for name, content in sources:
+            name = storage.save(name, ContentFile(content))
+            for field in self.fields:
+                names += field.attr_class.batch_render_variations(
+                    name, list(field.variations.values()), True, storage
+                )
+        files = {}
+        for name in names:
+            with storage.open(name) as f:
+                files[name] = f.read()
+        return files
+
+    def test_render_variations__threads(self, tmp_path, make_image):
+        sources = [
+            (
+                "%d-%s.%s" % (i, ext, ext),
+                make_image((200 + i * 7, 150 + i * 3), file_format, fill=i * 10),
+            )
+            for i in range(12)
+            for ext, file_format in [("jpg", "JPEG"), ("png", "PNG")]
+        ]
+        expected = self.render(str(tmp_path / "serial"), sources)
+        assert len(expected) == len(sources) * 10
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [
+                pool.submit(self.render, str(tmp_path / str(i)), [source])
+                for i in range(3)
+                for source in sources
+            ]
+            for future in futures:
+                for name, content in future.result().items():
+                    assert content == expected[name], name
+        # variations with unbounded sides are not changed by rendering
+        assert self.fields[1].variations["full"]["width"] is None
+        assert not ImageFile.LOAD_TRUNCATED_IMAGES
+
+    @pytest.mark.parametrize("load_truncated_images", [True, False])
+    def test_truncated_image(self, tmp_path, make_image, load_truncated_images):
+        storage = FileSystemStorage(location=str(tmp_path))
+        content = make_image((207, 153), fill=10)
+        name = storage.save("truncated.jpg", ContentFile(content[: len(content) // 2]))
+        variations = list(self.fields[0].variations.values())
+        if load_truncated_images:
+            StdImageFieldFile.batch_render_variations(
+                name, variations, True, storage, load_truncated_images=True
+            )
+            with Image.open(storage.path("truncated.thumbnail.jpg")) as img:
+                assert img.width == 100
+        else:
+            with pytest.raises(OSError):
+                StdImageFieldFile.batch_render_variations(
+                    name, variations, True, storage, load_truncated_images=False
+                )
+        assert not ImageFile.LOAD_TRUNCATED_IMAGES
+
+
+class TestFocus(TestStdImage):
+    @staticmethod
+    def make_image():
+        """Return a plain image, that is detailed on the right."""
+        img = Image.new("RGB", (600, 200), (128, 128, 128))
+        img.paste(Image.effect_noise((150, 200), 64).convert("RGB"), (450, 0))
+        with io.BytesIO() as f:
+            img.save(f, format="PNG")
+            return SimpleUploadedFile("focus.png", f.getvalue())
+
+    def test_get_focal_point(self):
+        img = Image.new("L", (600, 200), 128)
+        assert StdImageFieldFile.get_focal_point(img) == (0.5, 0.5)
+        img.paste(Image.effect_noise((150, 200), 64), (450, 0))
+        x, y = StdImageFieldFile.get_focal_point(img)
+        assert x > 0.75
+        assert y == pytest.approx(0.5, abs=0.1)
+
+    def test_get_centering(self):
+        get_centering = StdImageFieldFile.get_centering
+        assert get_centering((600, 200), (100, 100), (0.5, 0.5)) == (0.5, 0.5)
+        assert get_centering((600, 200), (100, 100), (0.9, 0.5)) == (1, 0.5)
+        assert get_centering((600, 200), (100, 100), (0.1, 0.2)) == (0, 0.5)
+        assert get_centering((400, 200), (100, 100), (0.5, 0.5)) == (0.5, 0.5)
+        assert get_centering((400, 200), (100, 100), (0.375, 0.5)) == (0.25, 0.5)
+
+    def test_render(self, db):
+        instance = models.FocusModel.objects.create(image=self.make_image())
+        field = instance._meta.get_field("image")
+        assert field.variations["square"]["focus"] == "entropy"
+        assert field.variations["square_webp"]["focus"] == "entropy"
+        assert field.variations["top"]["focus"] == (0.5, 0)
+        assert "focus" not in field.variations["thumbnail"]
+        for name in ["square", "square_webp"]:
+            with Image.open(getattr(instance.image, name).path) as img:
+                assert img.size == (100, 100)
+                # the crop shows the detailed part of the image
+                assert min(ImageStat.Stat(img).stddev) > 10
+
+    def test_render__single_focal_point(self, db, monkeypatch):
+        instance = models.FocusModel.objects.create(image=self.make_image())
+        calls = []
+        get_focal_point = StdImageFieldFile.get_focal_point
+
+        def _get_focal_point(img):
+            calls.append(img.size)
+            return get_focal_point(img)
+
+        monkeypatch.setattr(
+            StdImageFieldFile, "get_focal_point", staticmethod(_get_focal_point)
+        )
+        instance.image.render_variations()
+        assert calls == [(600, 200)]
+
+    def test_render__jpeg_field(self, tmp_path):
+        storage = FileSystemStorage(location=str(tmp_path))
+        name = storage.save("focus.png", self.make_image())
+        field = JPEGField(variations={"square": (100, 100, True)}, crop_focus="entropy")
+        (variation_name,) = field.attr_class.batch_render_variations(
+            name, list(field.variations.values()), True, storage
+        )
+        with Image.open(storage.path(variation_name)) as img:
+            assert img.size == (100, 100)
+            assert min(ImageStat.Stat(img).stddev) > 10
+
+
+class TestAsync(TestStdImage):
+    def test_asave(self, db):
+        instance = ResizeModel()
+        async_to_sync(instance.image.asave)("600x400.jpg", self.fixtures["600x400.jpg"])
+        instance = ResizeModel.objects.get()
+        assert instance.image.name == "img/600x400.jpg"
+        assert os.path.exists(instance.image.thumbnail.path)
+        assert instance.image.medium.width == 400
+
+    def test_asave__metadata(self, db):
+        instance = models.MetadataModel()
+        async_to_sync(instance.image.asave)("600x400.jpg", self.fixtures["600x400.jpg"])
+        instance = models.MetadataModel.objects.get()
+        assert instance.image_metadata["thumbnail"]["width"] == 100
+
+    def test_asave__single_save(self, db, monkeypatch):
+        instance = models.MetadataModel()
+        saves = []
+        model_save = models.MetadataModel.save
+
+        def _save(self, *args, **kwargs):
+            saves.append(self.image_metadata)
+            return model_save(self, *args, **kwargs)
+
+        monkeypatch.setattr(models.MetadataModel, "save", _save)
+        async_to_sync(instance.image.asave)("600x400.jpg", self.fixtures["600x400.jpg"])
+        assert len(saves) == 1
+        assert saves[0]["thumbnail"]["width"] == 100
+
+    def test_asave__callable(self, db):
+        instance = CustomRenderVariationsModel()
+        async_to_sync(instance.image.asave)("600x400.jpg", self.fixtures["600x400.jpg"])
+        # the callable rendered a 100x100 thumbnail itself
+        with Image.open(os.path.join(IMG_DIR, "600x400.thumbnail.jpg")) as img:
+            assert img.size == (100, 100)
+
+    def test_arender_variations(self, db, monkeypatch):
+        instance = ResizeModel.objects.create(image=self.fixtures["600x400.jpg"])
+        os.remove(instance.image.thumbnail.path)
+        loop_thread = []
+        render_threads = []
+        process_variations = StdImageFieldFile.process_variations.__func__
+
+        def _process_variations(cls, *args, **kwargs):
+            render_threads.append(threading.current_thread())
+            return process_variations(cls, *args, **kwargs)
+
+        monkeypatch.setattr(
+            StdImageFieldFile, "process_variations", classmethod(_process_variations)
+        )
+
+        async def render():
+            loop_thread.append(threading.current_thread())
+            await instance.image.arender_variations()
+
+        async_to_sync(render)()
+        assert os.path.exists(instance.image.thumbnail.path)
+        assert render_threads
+        assert loop_thread[0] not in render_threads
+
+
+class TestMaxPixels:
+    field = StdImageField(
+        variations={"thumbnail": (100, 75), "full": (None, None)},
+        max_pixels=40000,
+    )
+
+    def render(self, storage, name, content, max_pixels):
+        name = storage.save(name, ContentFile(content))
+        images = []
+        for variation_name in StdImageFieldFile.batch_render_variations(
+            name,
+            list(self.field.variations.values()),
+            True,
+            storage,
+            max_pixels=max_pixels,
+        ):
+            with Image.open(storage.path(variation_name)) as img:
+                img.load()
+                images.append(img)
+        return images
+
+    @pytest.mark.parametrize(
+        "name,file_format,mode,kwargs",
+        [
+            ("image.jpg", "JPEG", "RGB", {}),
+            ("image.bmp", "BMP", "RGB", {}),
+            ("image.tif", "TIFF", "RGBA", {}),
+            ("image.tif", "TIFF", "L", {}),
+            ("image.ppm", "PPM", "RGB", {}),
+        ],
+    )
+    def test_render(
+        self, tmp_path, monkeypatch, make_image, name, file_format, mode, kwargs
+    ):
+        storage = FileSystemStorage(location=str(tmp_path))
+        content = make_image((900, 601), file_format, mode, **kwargs)
+        expected = self.render(storage, name, content, None)
+
+        decoded = []
+        load_prepare = ImageFile.ImageFile.load_prepare
+
+        def _load_prepare(img):
+            decoded.append(img.size[0] * img.size[1])
+            return load_prepare(img)
+
+        monkeypatch.setattr(ImageFile.ImageFile, "load_prepare", _load_prepare)
+        thumbnail, full = self.render(storage, name, content, 40000)
+        assert max(decoded) <= 40000
+        assert full.size[0] * full.size[1] <= 40000
+        assert full.size[0] == pytest.approx(full.size[1] * 1.5, abs=2)
+        assert thumbnail.size == expected[0].size
+        assert thumbnail.mode == expected[0].mode
+        # a reduced source renders nearly the same thumbnail
+        diff = ImageChops.difference(
+            thumbnail.convert("RGB"), expected[0].convert("RGB")
+        )
+        assert max(ImageStat.Stat(diff).mean) < 2
+
+    def test_render__no_band_decoding(self, tmp_path, monkeypatch, make_image):
+        monkeypatch.setattr(StdImageFieldFile, "band_decoding", False)
+        storage = FileSystemStorage(location=str(tmp_path))
+        content = make_image((900, 601), "BMP")
+        with pytest.raises(Image.DecompressionBombError):
+            self.render(storage, "image.bmp", content, 40000)
+        with pytest.raises(ValidationError):
+            self.field.validate(SimpleUploadedFile("image.bmp", content), None)
+
+    def test_render__too_large(self, tmp_path, make_image):
+        storage = FileSystemStorage(location=str(tmp_path))
+        content = make_image((900, 601), "PNG")
+        with pytest.raises(Image.DecompressionBombError):
+            self.render(storage, "image.png", content, 40000)
+        assert self.render(storage, "image.png", content, None)
+
+    def test_validate(self, make_image):
+        self.field.validate(
+            SimpleUploadedFile("image.jpg", make_image((900, 601), "JPEG")), None
+        )
+        with pytest.raises(ValidationError) as e:
+            self.field.validate(
+                SimpleUploadedFile("image.png", make_image((900, 601), "PNG")),
+                None,
+            )
+        assert e.value.code == "max_pixels"
+        # more than 8 times the budget in both directions
+        with pytest.raises(ValidationError):
+            self.field.validate(
+                SimpleUploadedFile("image.jpg", make_image((2000, 1800), "JPEG")),
+                None,
+            )
+
+    def test_validate__shared_probe(self, monkeypatch, make_image):
+        field = StdImageField(
+            variations={"thumbnail": (100, 75)},
+            force_min_size=True,
+            max_pixels=40000,
+        )
+        calls = []
+        image_open = Image.open
+
+        def _open(fp):
+            calls.append(fp)
+            return image_open(fp)
+
+        monkeypatch.setattr(Image, "open", _open)
+        field.validate(
+            SimpleUploadedFile("image.jpg", make_image((900, 601), "JPEG")), None
+        )
+        assert len(calls) == 1
+
+
 class TestUtils(TestStdImage):
     """Tests Utils"""
 
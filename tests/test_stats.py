@@ -0,0 +1,74 @@
+import pickle
+
+from stdimage import signals
+from stdimage.stats import RenderStats
+from tests.models import RenderCacheModel, ResizeModel
+from tests.test_models import TestStdImage
+
+
+class TestSignals(TestStdImage):
+    def test_render(self, db):
+        loaded, rendered = [], []
+
+        def on_loaded(**kwargs):
+            loaded.append(kwargs)
+
+        def on_rendered(**kwargs):
+            rendered.append(kwargs)
+
+        signals.source_loaded.connect(on_loaded)
+        signals.variation_rendered.connect(on_rendered)
+        try:
+            ResizeModel.objects.create(image=self.fixtures["600x400.jpg"])
+        finally:
+            signals.source_loaded.disconnect(on_loaded)
+            signals.variation_rendered.disconnect(on_rendered)
+
+        assert len(loaded) == 1
+        assert loaded[0]["file_name"] == "img/600x400.jpg"
+        assert loaded[0]["size"] == (600, 400)
+        assert set(loaded[0]["timings"]) == {"read", "decode"}
+
+        assert [r["variation_name"] for r in rendered] == [
+            "img/600x400.medium.jpg",
+            "img/600x400.thumbnail.jpg",
+        ]
+        medium = rendered[0]
+        assert medium["variation"]["name"] == "medium"
+        assert medium["source_size"] == (600, 400)
+        assert medium["size"] == (400, 267)
+        assert medium["file_size"] > 0
+        assert not medium["cached"]
+        assert set(medium["timings"]) == {"resize", "encode", "write"}
+
+
+class TestRenderStats(TestStdImage):
+    def test_collect(self, db):
+        cache = RenderCacheModel._meta.get_field("image").render_cache
+        cache.clear()
+        with RenderStats() as stats:
+            for _ in range(2):
+                self.fixtures["600x400.jpg"].seek(0)
+                RenderCacheModel.objects.create(image=self.fixtures["600x400.jpg"])
+        # stats are not collected outside of the context
+        ResizeModel.objects.create(image=self.fixtures["600x400.jpg"])
+
+        assert stats.sources == 1
+        assert stats.source_pixels == 600 * 400
+        assert stats.variations["medium"]["count"] == 2
+        assert stats.variations["medium"]["cached"] == 1
+        assert stats.variations["thumbnail"]["pixels"] == 100 * 75
+
+        header, rows = stats.get_rows()
+        assert header[0] == "variation"
+        assert [row[0] for row in rows] == ["medium", "thumbnail", "(source)"]
+        assert "thumbnail" in stats.format_table()
+
+    def test_merge(self, db):
+        with RenderStats() as worker_stats:
+            ResizeModel.objects.create(image=self.fixtures["600x400.jpg"])
+        stats = RenderStats()
+        stats.merge(pickle.loads(pickle.dumps(worker_stats)))
+        stats.merge(worker_stats)
+        assert stats.sources == 2
+        assert stats.variations["medium"]["count"] == 2
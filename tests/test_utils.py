@@ -1,10 +1,17 @@
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
+from asgiref.sync import async_to_sync
+from django.core.files.storage import FileSystemStorage
 from PIL import Image
 
-from stdimage.utils import render_variations
-from tests.models import ManualVariationsModel
+from stdimage import signals
+from stdimage.storage import StorageIndex, deferred_deletes, delete_files
+from stdimage.utils import arender_variations, delete_variations, render_variations
+from tests.models import ManualVariationsModel, ThumbnailModel
+from tests.storage import BulkDeleteFileSystemStorage
 from tests.test_models import IMG_DIR
 
 
@@ -29,3 +36,106 @@ class TestRenderVariations:
             },
         )
         assert os.path.exists(path)
+
+    def test_arender_variations(self, image_upload_file):
+        instance = ManualVariationsModel.customer_manager.create(
+            image=image_upload_file
+        )
+        threads = set()
+
+        def receiver(sender, **kwargs):
+            threads.add(threading.current_thread().name)
+
+        signals.source_loaded.connect(receiver)
+        signals.variation_rendered.connect(receiver)
+        try:
+            with ThreadPoolExecutor(1, thread_name_prefix="render") as executor:
+                async_to_sync(arender_variations)(
+                    instance.image.name,
+                    instance._meta.get_field("image").variations,
+                    executor=executor,
+                )
+        finally:
+            signals.source_loaded.disconnect(receiver)
+            signals.variation_rendered.disconnect(receiver)
+        assert os.path.exists(os.path.join(IMG_DIR, "image.thumbnail.jpg"))
+        # rendered in the executor, written by the write workers
+        assert {name.split("_")[0] for name in threads} == {"render", "stdimage"}
+
+
+@pytest.mark.django_db
+class TestDeleteVariations:
+    def test_delete_variations(self, image_upload_file):
+        objs = [
+            ThumbnailModel.objects.create(image=image_upload_file) for _ in range(3)
+        ]
+        field = ThumbnailModel._meta.get_field("image")
+        delete_variations(
+            (obj.image.name for obj in objs),
+            field.variations,
+            storage=field.storage,
+            max_workers=2,
+        )
+        for obj in objs:
+            assert os.path.exists(obj.image.path)
+            assert not os.path.exists(obj.image.thumbnail.path)
+
+    def test_deferred_deletes(self, image_upload_file):
+        objs = [
+            ThumbnailModel.objects.create(image=image_upload_file) for _ in range(3)
+        ]
+        paths = [obj.image.path for obj in objs]
+        paths += [obj.image.thumbnail.path for obj in objs]
+        with deferred_deletes():
+            ThumbnailModel.objects.all().delete()
+            assert all(os.path.exists(path) for path in paths)
+        assert not any(os.path.exists(path) for path in paths)
+
+    def test_deferred_deletes__error(self, image_upload_file):
+        obj = ThumbnailModel.objects.create(image=image_upload_file)
+        with pytest.raises(ValueError):
+            with deferred_deletes():
+                ThumbnailModel.objects.all().delete()
+                raise ValueError
+        assert os.path.exists(obj.image.path)
+
+
+class TestDeleteFiles:
+    def test_thread_pool(self, tmp_path):
+        storage = FileSystemStorage(location=str(tmp_path))
+        for i in range(5):
+            (tmp_path / ("%d.jpg" % i)).touch()
+        delete_files(storage, ("%d.jpg" % i for i in range(5)), batch_size=2)
+        assert not list(tmp_path.iterdir())
+
+    def test_delete_many(self, tmp_path):
+        storage = BulkDeleteFileSystemStorage(location=str(tmp_path))
+        for i in range(5):
+            (tmp_path / ("%d.jpg" % i)).touch()
+        delete_files(storage, ["%d.jpg" % i for i in range(5)] * 2, batch_size=5)
+        assert storage.batches == [
+            ["0.jpg", "1.jpg", "2.jpg", "3.jpg", "4.jpg"],
+            ["0.jpg", "1.jpg", "2.jpg", "3.jpg", "4.jpg"],
+        ]
+        assert not list(tmp_path.iterdir())
+
+
+class TestStorageIndex:
+    def test_exists(self, tmp_path):
+        (tmp_path / "img").mkdir()
+        (tmp_path / "img" / "a.jpg").touch()
+        index = StorageIndex(FileSystemStorage(location=str(tmp_path)))
+        assert index.exists("img/a.jpg")
+        assert not index.exists("img/b.jpg")
+        assert not index.exists("missing/a.jpg")
+        index.add("img/b.jpg")
+        assert index.exists("img/b.jpg")
+        index.discard("img/a.jpg")
+        assert not index.exists("img/a.jpg")
+
+    def test_max_directories(self, tmp_path):
+        index = StorageIndex(FileSystemStorage(location=str(tmp_path)), 1)
+        index.add("a/a.jpg")
+        index.add("b/b.jpg")
+        assert list(index._directories) == ["b"]
+        assert not index.exists("a/a.jpg")
@@ -1,6 +1,20 @@
+from io import BytesIO
+
+from django.core.files.images import ImageFile
+from PIL import Image
+
 from stdimage import validators
 
 
+class ReadCountingBytesIO(BytesIO):
+    bytes_read = 0
+
+    def read(self, *args, **kwargs):
+        data = super().read(*args, **kwargs)
+        self.bytes_read += len(data)
+        return data
+
+
 class TestBaseSizeValidator:
     def test_init__none(self):
         assert validators.MinSizeValidator(None, None).limit_value == (
@@ -59,3 +73,32 @@ class TestMinSizeValidator:
         assert instance.compare((150, 100), (300, 200))
         assert instance.compare((300, 100), (300, 200))
         assert instance.compare((150, 200), (300, 200))
+
+
+class TestGetImageSize:
+    def test_header_only(self):
+        img = Image.effect_noise((1000, 1000), 64)
+        stream = ReadCountingBytesIO()
+        img.save(stream, format="PNG")
+        stream.bytes_read = 0
+        assert validators.get_image_size(stream) == (1000, 1000)
+        assert stream.bytes_read < len(stream.getvalue()) / 2
+        assert stream.tell() == 0
+
+    def test_shared_probe(self, monkeypatch, image_upload_file):
+        calls = []
+        image_open = Image.open
+
+        def _open(fp):
+            calls.append(fp)
+            return image_open(fp)
+
+        monkeypatch.setattr(validators.Image, "open", _open)
+        validators.MinSizeValidator(100, 100)(image_upload_file)
+        validators.MaxSizeValidator(500, 500)(image_upload_file)
+        assert len(calls) == 1
+
+    def test_field_file(self, image_upload_file):
+        file = ImageFile(image_upload_file)
+        assert validators.get_image_size(file) == (250, 250)
+        assert (file.width, file.height) == (250, 250)